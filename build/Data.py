@@ -3,6 +3,8 @@ from queue import Queue
 from tkinter import simpledialog, messagebox, filedialog
 import numpy as np
 
+from regrid import regrid
+
 class Data:
     def __init__(self):
         self.queue = Queue()
@@ -137,11 +139,7 @@ class Data:
             y_data = np.array(self.data[name]['original'][1])
             if len(x_data) == 0:
                 raise ValueError(f"Dataset '{name}' has no data points.")
-            unique_x_data = np.unique(x_data)  # We do this to remove duplicate x values since interpolation will fail
-            compressed_x_data = unique_x_data
-            compressed_y_data = [np.mean(y_data[np.isclose(x_data, x ,atol=1e-5)]) for x in unique_x_data]
-            new_x_data = np.arange(min(compressed_x_data), max(compressed_x_data) + 0.001, 0.001)
-            new_y_data = np.interp(new_x_data, compressed_x_data, compressed_y_data)
+            new_x_data, new_y_data = regrid(x_data, y_data)
             self.data[name]['extended'] = (new_x_data, new_y_data)
 
     def calc_reference(self, new_data):
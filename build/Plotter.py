@@ -118,15 +118,16 @@ class Plotter:
 
     def updater(self, i):
         while not self.out_queue.empty():
-            new_data = self.out_queue.get()
-            if self.gui.get_reference():
-                new_data = self.data_holder.calc_reference(new_data)
-            if not new_data:
-                continue
-            self.x_data.append(new_data[0])
-            self.y_data.append(new_data[1])
-            print(new_data)
-            self.data_holder.live_data.append((new_data[0], new_data[1]))
+            x_batch, y_batch = self.out_queue.get()  # Sampler pushes one (x_array, y_array) batch per read
+            for new_data in zip(x_batch.tolist(), y_batch.tolist()):
+                if self.gui.get_reference():
+                    new_data = self.data_holder.calc_reference(new_data)
+                if not new_data:
+                    continue
+                self.x_data.append(new_data[0])
+                self.y_data.append(new_data[1])
+                print(new_data)
+                self.data_holder.live_data.append((new_data[0], new_data[1]))
 
         if len(self.x_data) > self.sample_cutoff:
             self.x_data = self.x_data[-self.sample_cutoff:]
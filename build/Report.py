@@ -12,7 +12,7 @@ def resource_path(relative_path):
     try:
         base_path = sys._MEIPASS
     except AttributeError:
-        base_path = os.path.abspath(".")
+        base_path = os.path.dirname(os.path.abspath(__file__))  # not the cwd - batch.py runs from anywhere
     return os.path.join(base_path, relative_path)
 
 class Report:
@@ -45,7 +45,8 @@ class Report:
         plt.close(new_fig)
 
     @staticmethod
-    def create_report(save_path, temp_plot_path):
+    def create_report(save_path, temp_plot_path, title="MEASUREMENT REPORT", rows=None):
+        # rows: optional table rows of strings (first row = header) added below the plot
         image_path = resource_path('pics/logo-LAB-motion-systems.png')
         if not os.path.exists(image_path):
             raise FileNotFoundError(f"Required image not found: {image_path}")
@@ -53,7 +54,6 @@ class Report:
             raise FileNotFoundError(f"Plot image not found: {temp_plot_path}")
 
         # Create a PDF document with A4 size in landscape mode
-        pdf_file = "example.pdf"
         doc = SimpleDocTemplate(save_path, pagesize=landscape(A4), leftMargin=50, rightMargin=50, topMargin=30,
                                 bottomMargin=50)
 
@@ -69,7 +69,7 @@ class Report:
         # normal_style = styles['BodyText']
 
         # Title and content
-        title = Paragraph("MEASUREMENT REPORT", title_style)
+        title = Paragraph(title, title_style)
         # content = Paragraph("content", normal_style)
 
         # Path to the image (replace 'your_image.png' with your image path)
@@ -115,8 +115,21 @@ class Report:
                 img_width = max_height * aspect_ratio
 
         plot_image = Image(temp_plot_path, height=img_height, width=img_width)
+
+        results_table = None
+        if rows:
+            results_table = Table(rows, repeatRows=1, hAlign='LEFT')
+            results_table.setStyle(TableStyle([
+                ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, -1), 10),
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+                ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+            ]))
         # Combine elements into a story
         story = [table, Spacer(1, 20), title, Spacer(1, 20), plot_image]
+        if results_table:
+            story += [Spacer(1, 20), results_table]
 
         # Build the PDF
         try:
@@ -124,4 +137,4 @@ class Report:
         except Exception as e:
             raise RuntimeError(f"Failed to write PDF (it may be open in another program):\n{e}") from e
 
-        print(f"PDF created successfully: {pdf_file}")
+        print(f"PDF created successfully: {save_path}")
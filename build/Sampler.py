@@ -4,6 +4,8 @@ import serial.tools.list_ports
 import threading
 import numpy as np
 
+from acquisition import FrameParser, decode_frames
+
 
 class Sampler:
     def __init__(self, root, data):
@@ -18,11 +20,12 @@ class Sampler:
         self.zero_point = 0
         self.serial_available = False
         self.port = None
+        self.parser = FrameParser()
         self.connect()
         self.stop_event = threading.Event()
 
     def set_zero_point(self):
-        if self.data_holder.live_data:
+        if self.data_holder.get_number_live_data():
             print("Zero point set", self.last_data)
             self.zero_point = self.last_data
 
@@ -74,6 +77,7 @@ class Sampler:
         else:
             self.sampling = True
             self.stop_event.clear()  # Clear the stop event
+            self.parser.reset()
             self.thread = threading.Thread(target=self.sample_data, args=(self.stop_event,), daemon=True)
             self.thread.start()
         return self.sampling
@@ -100,29 +104,29 @@ class Sampler:
                 live = self.thread.is_alive()
                 if live:
                     print("Sampler thread still alive")
+            if self.parser.frames or self.parser.errors or self.parser.resyncs:
+                print(f"Sampler: {self.parser.frames} frames, {self.parser.errors} ERR, "
+                      f"{self.parser.resyncs} resyncs")
 
     def sample_data(self, duration=1):  # Runs continuously until stop_event is set.
+        # Reads everything the port has buffered in one go (or blocks for up to
+        # the port timeout when it's empty, instead of spinning on in_waiting) and
+        # pushes each read's frames on the queue as one (x_array, y_array) batch.
         while not self.stop_event.is_set():
             try:
-                if self.ser.in_waiting > 0:
-                    data = self.ser.read_until(b'\n')  # Read until newline character
-                    print(data)
-                    parts = data.split(b'\r')
-                    if parts[0].startswith(b'\x80\x06\x83') and len(parts) > 1:
-                        xa = parts[0][3:-1].decode('ascii', errors='ignore')  # Skip first 3 and last byte
-                        if 'ERR' in xa:  # Sensor reports out-of-range/error frame instead of a reading
-                            continue
-                        # Remove any unwanted characters (non-numeric)
-                        cleaned_str = ''.join(filter(lambda x: x.isdigit() or x == '.', xa))
-                        xi = self.convert_x_data(cleaned_str)
-                        yi = self.convert_y_data(parts[1])
-                        if xi is None or yi is None:
-                            continue
-                        self.in_queue.put((xi, yi))
-
-            except serial.serialutil.SerialException:
+                chunk = self.ser.read(self.ser.in_waiting or 1)
+                frames = self.parser.feed(chunk)
+                if not frames:
+                    continue
+                x, y, last_raw = decode_frames(frames, self.zero_point, self.flip_orientation)
+                if last_raw is None:
+                    continue
+                self.last_data = last_raw
+                self.in_queue.put((x, y))
+
+            except serial.serialutil.SerialException as e:
                 self.stop_event.set()
-                """ Some extra handling needed here """
+                print(f"Serial connection lost, sampling stopped: {e}")  # samples so far are kept (and on disk if recording)
             except Exception:
                 self.stop_event.set()
 
@@ -162,5 +166,5 @@ class Sampler:
             xi = x - self.zero_point  # Subtract zero point
             if self.flip_orientation:  # Flip orientation if needed
                 xi = -xi
-            self.in_queue.put((xi, y))
+            self.in_queue.put((np.array([xi]), np.array([y])))
             sleep(0.01)
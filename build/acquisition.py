@@ -0,0 +1,193 @@
+# acquisition.py
+#
+# Serial acquisition engine for the LASER/ADC stream coming out of the Nano.
+# Each frame on the wire is
+#
+#     \x80\x06\x83 <ASCII distance> <checksum byte> \r <ASCII ADC counts> \n
+#
+# FrameParser is an incremental state machine over whatever bytes happen to be
+# available: a partial frame at the end of one read is kept and completed by
+# the next, garbage between frames is skipped (and counted as a resync), and
+# ERR frames are dropped. decode_frames() turns a batch of complete frames into
+# two float64 arrays at once, which is what Sampler pushes on DataStore.queue.
+#
+# ReplaySerial is a loopback stand-in for serial.Serial that replays a
+# recorded byte stream, so the whole pipeline can run without an Arduino
+# (see bench_acquisition.py).
+
+import numpy as np
+import serial
+
+FRAME_HEADER = b'\x80\x06\x83'
+MAX_FRAME_LENGTH = 64  # a real frame is ~20 bytes; anything longer lost its '\n'
+
+# Everything except digits and '.' - bytes.translate(None, delete=...) strips
+# these in C instead of filtering character by character in Python.
+_NON_NUMERIC = bytes(b for b in range(256) if not (0x30 <= b <= 0x39 or b == 0x2E))
+
+
+class FrameParser:
+    """Splits a raw byte stream into (distance, adc) byte pairs. Keeps state
+    between feed() calls so frames may be split over any number of reads."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.frames = 0  # complete, non-ERR frames returned so far
+        self.errors = 0  # ERR frames reported by the sensor
+        self.resyncs = 0  # times bytes had to be thrown away to find the next header
+
+    def reset(self):
+        self._buffer.clear()
+        self.frames = self.errors = self.resyncs = 0
+
+    def feed(self, chunk):
+        buffer = self._buffer
+        buffer += chunk
+        frames = []
+        pos = 0
+        end = len(buffer)
+        while pos < end:
+            start = buffer.find(FRAME_HEADER, pos)
+            if start < 0:
+                # Keep a possible header prefix split over two reads, drop the rest.
+                keep = end - len(FRAME_HEADER) + 1
+                if keep > pos:
+                    self.resyncs += 1
+                    pos = keep
+                break
+            if start != pos:
+                self.resyncs += 1
+            newline = buffer.find(b'\n', start)
+            if newline < 0:
+                if end - start > MAX_FRAME_LENGTH:  # newline lost, skip to the next header
+                    self.resyncs += 1
+                    pos = start + 1
+                    continue
+                pos = start  # partial frame, completed by the next read
+                break
+            next_header = buffer.find(FRAME_HEADER, start + 1, newline)
+            if next_header >= 0:  # frame truncated on the wire, start over at the next one
+                self.resyncs += 1
+                pos = next_header
+                continue
+
+            # Last \r, not first: the checksum byte in front of the separator can
+            # itself be 0x0D, while the ADC field after it is digits only.
+            separator = buffer.rfind(b'\r', start, newline)
+            pos = newline + 1
+            if separator < 0:
+                self.resyncs += 1
+                continue
+            distance = bytes(buffer[start + len(FRAME_HEADER):separator - 1])  # drop trailing checksum byte
+            if b'ERR' in distance:  # sensor reports out-of-range/error frame instead of a reading
+                self.errors += 1
+                continue
+            adc = bytes(buffer[separator + 1:newline]).strip()
+            if not adc.lstrip(b'-').isdigit():
+                self.resyncs += 1
+                continue
+            frames.append((distance, adc))
+        del buffer[:pos]
+        self.frames += len(frames)
+        return frames
+
+
+def decode_frames(frames, zero_point=0.0, flip_orientation=False):
+    """Converts a batch of frames from FrameParser.feed() into (x, y) float64
+    arrays. Frames that don't parse are dropped. Also returns the last raw
+    distance (before zero point / orientation), or None if nothing parsed."""
+    distances = [distance.translate(None, _NON_NUMERIC) for distance, _ in frames]
+    counts = [adc.strip() for _, adc in frames]
+    try:
+        x = np.array(distances, dtype=np.bytes_).astype(np.float64)
+        y = np.array(counts, dtype=np.bytes_).astype(np.float64)
+    except ValueError:  # at least one bad frame in the batch - sort them out one by one
+        x, y = _decode_one_by_one(distances, counts)
+    if len(x) == 0:
+        return x, y, None
+
+    last_raw = float(x[-1])
+    x -= zero_point
+    if flip_orientation:
+        np.negative(x, out=x)
+    y *= 2 * 0.1875 / 50.0  # same conversion as Sampler.convert_y_data
+    return x, y, last_raw
+
+
+def _decode_one_by_one(distances, counts):
+    x, y = [], []
+    for distance, adc in zip(distances, counts):
+        try:
+            xi = float(distance)
+            yi = float(int(adc))
+        except ValueError:
+            print("Error:", distance, adc)
+            continue
+        x.append(xi)
+        y.append(yi)
+    return np.array(x, dtype=np.float64), np.array(y, dtype=np.float64)
+
+
+def encode_frame(distance, adc):
+    """Builds one wire frame, used to synthesize replay streams."""
+    return FRAME_HEADER + f"{distance:08.4f}".encode('ascii') + b'\x00' + b'\r' + str(int(adc)).encode('ascii') + b'\n'
+
+
+class ReplaySerial:
+    """Minimal serial.Serial stand-in that plays back a recorded byte stream.
+
+    chunk_size limits how many bytes become available per read, to mimic a
+    slow link delivering frames in pieces. Once the stream is exhausted it
+    raises SerialException, the same as an unplugged USB cable, unless loop is
+    set, in which case it starts over."""
+
+    def __init__(self, stream, chunk_size=None, loop=False):
+        self._stream = bytes(stream)
+        self._pos = 0
+        self.chunk_size = chunk_size
+        self.loop = loop
+        self.is_open = True
+        self.written = bytearray()
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path, 'rb') as f:
+            return cls(f.read(), **kwargs)
+
+    def _available(self):
+        if not self.is_open:
+            raise serial.SerialException("Port is closed")
+        remaining = len(self._stream) - self._pos
+        if remaining == 0:
+            if not self.loop or not self._stream:
+                raise serial.SerialException("Replay stream exhausted")
+            self._pos = 0
+            remaining = len(self._stream)
+        if self.chunk_size is not None:
+            remaining = min(remaining, self.chunk_size)
+        return remaining
+
+    @property
+    def in_waiting(self):
+        return self._available()
+
+    def read(self, size=1):
+        size = min(size, self._available())
+        data = self._stream[self._pos:self._pos + size]
+        self._pos += size
+        return data
+
+    def read_until(self, expected=b'\n'):
+        data = bytearray()
+        while True:
+            byte = self.read(1)
+            data += byte
+            if data.endswith(expected):
+                return bytes(data)
+
+    def write(self, data):
+        self.written += data
+        return len(data)
+
+    def close(self):
+        self.is_open = False
@@ -0,0 +1,234 @@
+# archive.py
+#
+# Binary session file for many measurements (".lab"). Layout:
+#
+#     b'LABARCH1'                            magic
+#     float64 arrays, little-endian          8-byte aligned, written one after another
+#     JSON index                             name -> {arrays: {key: [offset, length]},
+#                                                     coefficients, results}
+#     <u8 index offset> <u8 index length> b'LABARCH1'   trailer
+#
+# The index sits at the end so arrays can be streamed to disk as they come
+# (e.g. straight out of a CSV row) without knowing the file layout up front.
+# Reading only parses the index and memory-maps the file: every array is a
+# read-only view whose pages are loaded by the OS when something actually
+# touches them (plotting, regridding), so opening a multi-GB file is instant.
+#
+# The CSV helpers stream the existing one-row-per-axis format row by row, so
+# converting never holds more than one axis in memory.
+#
+# Like data_model.py this never shows a dialog; callers handle ValueError/OSError.
+
+import csv
+import json
+import os
+import struct
+import weakref
+from types import SimpleNamespace
+
+import numpy as np
+
+MAGIC = b'LABARCH1'
+_TRAILER = struct.Struct('<QQ8s')
+_DTYPE = np.dtype('<f8')
+_CSV_CHUNK = 65536  # values formatted per write when streaming an axis to CSV
+
+# Array keys stored per measurement; derived ones are optional.
+ORIGINAL_KEYS = ('original_x', 'original_y')
+EXTENDED_KEYS = ('extended_x', 'extended_y')
+
+_mappings = {}  # absolute path -> weak references to the np.memmap objects read_archive() opened on it
+
+
+class ArchiveWriter:
+    """Streams arrays into a new archive. Use as a context manager - the index
+    is only written on a clean close, an interrupted write leaves no index and
+    is rejected by read_archive()."""
+
+    def __init__(self, path):
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._index = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+
+    def _entry(self, name):
+        return self._index.setdefault(name, {'arrays': {}, 'coefficients': None, 'results': {}})
+
+    def add_array(self, name, key, values):
+        values = np.ascontiguousarray(values, dtype=_DTYPE)
+        offset = self._file.tell()
+        values.tofile(self._file)
+        self._entry(name)['arrays'][key] = [offset, len(values)]
+
+    def add_measurement(self, measurement, include_derived=True):
+        name = measurement.name
+        for key, values in zip(ORIGINAL_KEYS, measurement.original):
+            self.add_array(name, key, values)
+        if not include_derived:
+            return
+        if measurement.extended is not None:
+            for key, values in zip(EXTENDED_KEYS, measurement.extended):
+                self.add_array(name, key, values)
+        entry = self._entry(name)
+        if measurement.coefficients is not None:
+            entry['coefficients'] = [float(c) for c in measurement.coefficients]
+        entry['results'] = {key: float(value) for key, value in measurement.results.items()
+                            if isinstance(value, (int, float, np.number))}
+
+    def close(self):
+        if self._file.closed:
+            return
+        index = json.dumps(self._index).encode('utf-8')
+        offset = self._file.tell()
+        self._file.write(index)
+        self._file.write(_TRAILER.pack(offset, len(index), MAGIC))
+        self._file.close()
+
+
+def is_archive(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_archive(path):
+    """Returns name -> {'original', 'extended', 'coefficients', 'results'} with
+    every array a read-only memory-mapped view. Missing arrays come back empty
+    ('original') or None ('extended')."""
+    size = os.path.getsize(path)
+    if size < len(MAGIC) + _TRAILER.size:
+        raise ValueError(f"{os.path.basename(path)} is not a measurement archive.")
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{os.path.basename(path)} is not a measurement archive.")
+        f.seek(size - _TRAILER.size)
+        offset, length, magic = _TRAILER.unpack(f.read(_TRAILER.size))
+        if magic != MAGIC or offset + length > size - _TRAILER.size:
+            raise ValueError(f"{os.path.basename(path)} is incomplete (interrupted save?).")
+        f.seek(offset)
+        index = json.loads(f.read(length).decode('utf-8'))
+
+    mapped = np.memmap(path, dtype=np.uint8, mode='r')
+    _mappings.setdefault(os.path.abspath(path), []).append(weakref.ref(mapped))
+
+    def view(location):
+        start, count = location
+        return np.frombuffer(mapped, dtype=_DTYPE, count=count, offset=start)
+
+    empty = np.empty(0, dtype=_DTYPE)
+    loaded = {}
+    for name, entry in index.items():
+        arrays = entry.get('arrays', {})
+        original = tuple(view(arrays[key]) if key in arrays else empty for key in ORIGINAL_KEYS)
+        extended = None
+        if all(key in arrays for key in EXTENDED_KEYS):
+            extended = tuple(view(arrays[key]) for key in EXTENDED_KEYS)
+        coefficients = entry.get('coefficients')
+        loaded[name] = {
+            'original': original,
+            'extended': extended,
+            'coefficients': tuple(coefficients) if coefficients is not None else None,
+            'results': dict(entry.get('results') or {}),
+        }
+    return loaded
+
+
+def mapped_file(array):
+    """Path of the file `array` is memory-mapped from, or None."""
+    while array is not None:
+        if isinstance(array, np.memmap) and array.filename is not None:
+            return array.filename
+        array = getattr(array, 'base', None)
+    return None
+
+
+def uses_file(arrays, path):
+    """True if any array in `arrays` (None entries allowed) is mapped from `path`."""
+    path = os.path.abspath(path)
+    return any(mapped_file(array) == path for array in arrays if array is not None)
+
+
+def is_mapped(path):
+    """True while any view of an archive read from `path` is still alive -
+    the mapping is closed when the last one goes."""
+    path = os.path.abspath(path)
+    alive = [ref for ref in _mappings.get(path, []) if ref() is not None]
+    if alive:
+        _mappings[path] = alive
+    else:
+        _mappings.pop(path, None)
+    return bool(alive)
+
+
+# --- CSV (one row per axis: name, 'X'|'Y', values...) ---------------------------------
+
+def iter_csv(path):
+    """Yields (name, axis, values) per row as float64 arrays, or None for a
+    malformed/short row. Only one row is ever held in memory."""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.reader(f):
+            if len(row) < 3 or row[1] not in ('X', 'Y'):  # only original data is ever loaded
+                yield None
+                continue
+            try:
+                values = np.array(row[2:], dtype=np.float64)
+            except ValueError:
+                yield None
+                continue
+            yield row[0], row[1], values
+
+
+def write_csv(path, measurements):
+    """Writes the original data of `measurements`, formatting each axis in
+    chunks instead of building the whole row as a list of Python objects."""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, lineterminator='')
+        for measurement in measurements:
+            for axis, values in zip(('X', 'Y'), measurement.original):
+                writer.writerow([measurement.name, axis])
+                values = np.asarray(values, dtype=np.float64)
+                for start in range(0, len(values), _CSV_CHUNK):
+                    f.write(',')
+                    f.write(','.join(map(repr, values[start:start + _CSV_CHUNK].tolist())))
+                f.write('\r\n')
+
+
+def csv_to_archive(csv_path, archive_path):
+    """Streams a CSV save file into an archive (original data only). Returns
+    the number of malformed rows that were skipped."""
+    skipped_rows = 0
+    with ArchiveWriter(archive_path) as writer:
+        for row in iter_csv(csv_path):
+            if row is None:
+                skipped_rows += 1
+                continue
+            name, axis, values = row
+            writer.add_array(name, ORIGINAL_KEYS[0] if axis == 'X' else ORIGINAL_KEYS[1], values)
+    return skipped_rows
+
+
+def archive_to_csv(archive_path, csv_path):
+    entries = read_archive(archive_path)
+    # write_csv only needs .name and .original
+    write_csv(csv_path, (SimpleNamespace(name=name, original=entry['original']) for name, entry in entries.items()))
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3:
+        sys.exit("usage: python archive.py <input.csv|input.lab> <output.lab|output.csv>")
+    source, target = sys.argv[1:]
+    if is_archive(source):
+        archive_to_csv(source, target)
+    else:
+        skipped = csv_to_archive(source, target)
+        if skipped:
+            print(f"{skipped} malformed row(s) ignored")
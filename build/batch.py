@@ -0,0 +1,311 @@
+# batch.py
+#
+# Headless batch evaluation of saved measurement files (.lab archives and
+# .csv saves) - no Qt/Tk, matplotlib on the Agg backend only, so it runs on a
+# build server or from a cron job:
+#
+#     python batch.py <directory> [-o <output dir>] [-j <workers>] [--group all|file] [--no-reports]
+#
+# Every measurement is loaded, regridded, detrended and evaluated (slope, ptp)
+# through DataStore exactly as in the GUI, one job per measurement (per file
+# for CSV, which has no index to pick a single measurement from) in a process
+# pool. The same job renders that measurement's PDF report. The detrended
+# profiles are then stacked on a common grid - everything together, or per
+# file with --group file - for the metrics from "TO DO":
+#
+#   straightness  ptp of the mean detrended profile: the systematic deviation
+#                 of the travel from a straight line
+#   repeatability largest spread between the runs at any one grid position
+#   flatness      ptp of the envelope of all detrended runs: the band every
+#                 measured run stays within, repeatable or not
+#
+# Results go to summary.csv (one row per measurement, one per group) and to
+# summary.pdf.
+
+import argparse
+import csv
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+
+import matplotlib
+matplotlib.use('Agg')  # before anything imports pyplot (Report does)
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+import archive
+from data_model import DataStore
+from decimation import minmax_decimate
+from regrid import DEFAULT_STEP, DEFAULT_TOLERANCE
+from Report import Report
+
+FILE_SUFFIXES = ('.lab', '.csv')
+PLOT_PIXELS = 2000  # points per series handed to matplotlib, see decimation.py
+
+
+@dataclass
+class MeasurementResult:
+    source: str  # file name the measurement was loaded from
+    name: str
+    points: int = 0
+    slope: Optional[float] = None  # µm/m
+    ptp: Optional[float] = None  # raw peak-to-peak in µm, trend included
+    straightness: Optional[float] = None  # detrended peak-to-peak in µm
+    grid: Optional[tuple] = None  # detrended (x, y) on the regrid grid, for stacking
+    report: Optional[str] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class StackMetrics:
+    group: str
+    runs: int
+    x_range: Optional[tuple] = None  # common x range every run covers
+    straightness: Optional[float] = None
+    repeatability: Optional[float] = None  # None for a single run
+    flatness: Optional[float] = None
+
+
+@dataclass
+class BatchSummary:
+    results: list
+    metrics: list
+    elapsed: float = 0.0
+    skipped: list = field(default_factory=list)  # "<file>: <name>: <reason>"
+
+
+def find_measurement_files(directory):
+    return sorted(os.path.join(directory, entry) for entry in os.listdir(directory)
+                  if entry.lower().endswith(FILE_SUFFIXES) and os.path.isfile(os.path.join(directory, entry)))
+
+
+def _jobs(path):
+    # (path, [name]) per measurement for an archive - its index is read without
+    # touching the data - and (path, None) = "everything" for a CSV file. A
+    # file that can't be read becomes a failed result instead.
+    try:
+        if archive.is_archive(path):
+            return [(path, [name]) for name in archive.read_archive(path)], []
+    except (OSError, ValueError) as e:
+        return [], [MeasurementResult(os.path.basename(path), '*', error=str(e))]
+    return [(path, None)], []
+
+
+def evaluate_file(path, names=None, report_dir=None, grid_step=DEFAULT_STEP, grid_tolerance=DEFAULT_TOLERANCE):
+    """Loads `names` (all if None) from `path` and evaluates them; writes a
+    PDF per measurement to report_dir if given. Runs in a worker process."""
+    source = os.path.basename(path)
+    store = DataStore(grid_step, grid_tolerance)
+    try:
+        parsed = store.load(path)
+    except (OSError, ValueError) as e:
+        return [MeasurementResult(source, name, error=str(e)) for name in (names or ['*'])]
+    loaded = {name: m for name, m in parsed.measurements.items() if names is None or name in names}
+    if not loaded:
+        return [MeasurementResult(source, '*', error=f"no measurements ({parsed.skipped_rows} malformed row(s))")]
+    imported = store.import_measurements(loaded, lambda name: None)
+
+    results = [MeasurementResult(source, name, error="no data") for name in imported.skipped]
+    for name in imported.loaded:
+        measurement = store.measurements[name]
+        result = MeasurementResult(source, name, points=len(measurement.original[0]),
+                                   ptp=float(measurement.results['ptp']))
+        if measurement.coefficients is not None:
+            result.slope = float(measurement.coefficients[0])
+            result.straightness = float(np.ptp(measurement.detrended[1]))
+            result.grid = tuple(np.array(values) for values in measurement.detrended)  # copy out of the memmap
+        if report_dir is not None:
+            try:
+                result.report = write_measurement_report(measurement, result, report_dir)
+            except (OSError, ValueError, RuntimeError) as e:
+                result.error = f"report failed: {e}"
+        results.append(result)
+    return results
+
+
+def stack_metrics(group, results, grid_step=DEFAULT_STEP):
+    """Straightness/repeatability/flatness of the detrended runs in `results`,
+    interpolated onto the grid over the x range all of them cover."""
+    grids = [result.grid for result in results if result.grid is not None]
+    metrics = StackMetrics(group, runs=len(grids))
+    if not grids:
+        return metrics
+    x_min = max(x[0] for x, _ in grids)
+    x_max = min(x[-1] for x, _ in grids)
+    if x_max < x_min:
+        return metrics  # the runs don't overlap
+    common_x = np.arange(x_min, x_max + grid_step / 2, grid_step)
+    stacked = np.vstack([np.interp(common_x, x, y) for x, y in grids])
+    metrics.x_range = (float(x_min), float(x_max))
+    metrics.straightness = float(np.ptp(stacked.mean(axis=0)))
+    metrics.flatness = float(stacked.max() - stacked.min())
+    if len(grids) > 1:
+        metrics.repeatability = float(np.ptp(stacked, axis=0).max())
+    return metrics
+
+
+# --- reports --------------------------------------------------------------------
+
+def _safe_filename(text):
+    return re.sub(r'[^\w.-]+', '_', text).strip('_') or 'measurement'
+
+
+def _format(value, digits=2):
+    return '-' if value is None else f"{value:.{digits}f}"
+
+
+def _render(figure, path):
+    FigureCanvasAgg(figure)  # Figure + Agg canvas directly - no pyplot state shared between reports
+    figure.savefig(path, format='png')
+
+
+def write_measurement_report(measurement, result, report_dir):
+    figure = Figure(figsize=(10, 6))
+    top, bottom = figure.subplots(2, 1, sharex=True)
+    x, y = minmax_decimate(*measurement.original, PLOT_PIXELS)
+    top.plot(x, y, label=f"{measurement.name} (original)")
+    if measurement.coefficients is not None:
+        a, b = measurement.coefficients
+        ends = np.array([np.min(x), np.max(x)])
+        top.plot(ends, a * ends + b, linestyle='--', label=f"Trend: {a:.2f}x + {b:.2f}")
+        bottom.plot(*minmax_decimate(*measurement.detrended, PLOT_PIXELS), label=f"{measurement.name} (detrended)")
+    for ax in (top, bottom):
+        ax.set_ylabel('Displacement (µm)')
+        ax.grid(True)
+        if ax.get_lines():
+            ax.legend()
+    top.set_title(f"{result.source}: {measurement.name}")
+    bottom.set_xlabel('Distance (m)')
+
+    stem = _safe_filename(f"{os.path.splitext(result.source)[0]}-{measurement.name}")
+    pdf_path = os.path.join(report_dir, stem + '.pdf')
+    table = [['Quantity', 'Value'],
+             ['File', result.source],
+             ['Measurement', measurement.name],
+             ['Points', str(result.points)],
+             ['Slope (µm/m)', _format(result.slope)],
+             ['Peak-to-peak (µm)', _format(result.ptp)],
+             ['Straightness (µm)', _format(result.straightness)]]
+    with tempfile.TemporaryDirectory() as scratch:
+        plot_path = os.path.join(scratch, 'plot.png')
+        _render(figure, plot_path)
+        Report.create_report(pdf_path, plot_path, rows=table)
+    return pdf_path
+
+
+def write_summary(summary, output_dir):
+    csv_path = os.path.join(output_dir, 'summary.csv')
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['file', 'measurement', 'points', 'slope (um/m)', 'ptp (um)', 'straightness (um)', 'error'])
+        for r in summary.results:
+            writer.writerow([r.source, r.name, r.points, _format(r.slope, 4), _format(r.ptp, 4),
+                             _format(r.straightness, 4), r.error or ''])
+        writer.writerow([])
+        writer.writerow(['group', 'runs', 'x min (m)', 'x max (m)', 'straightness (um)', 'repeatability (um)',
+                         'flatness (um)'])
+        for m in summary.metrics:
+            x_min, x_max = m.x_range or (None, None)
+            writer.writerow([m.group, m.runs, _format(x_min, 4), _format(x_max, 4), _format(m.straightness, 4),
+                             _format(m.repeatability, 4), _format(m.flatness, 4)])
+
+    figure = Figure(figsize=(10, 6))
+    ax = figure.subplots()
+    for r in summary.results:
+        if r.grid is not None:
+            ax.plot(*minmax_decimate(*r.grid, PLOT_PIXELS), label=f"{r.source}: {r.name}", linewidth=0.8)
+    ax.set_xlabel('Distance (m)')
+    ax.set_ylabel('Displacement (µm)')
+    ax.set_title('Detrended runs')
+    ax.grid(True)
+    if ax.get_lines() and len(summary.results) <= 12:  # a legend with dozens of entries only hides the plot
+        ax.legend()
+
+    table = [['Group', 'Runs', 'Straightness (µm)', 'Repeatability (µm)', 'Flatness (µm)']]
+    table += [[m.group, str(m.runs), _format(m.straightness), _format(m.repeatability), _format(m.flatness)]
+              for m in summary.metrics]
+    table += [['Measurement', 'Points', 'Slope (µm/m)', 'Peak-to-peak (µm)', 'Straightness (µm)']]
+    table += [[f"{r.source}: {r.name}", str(r.points), _format(r.slope), _format(r.ptp), _format(r.straightness)]
+              for r in summary.results if r.error is None]
+    pdf_path = os.path.join(output_dir, 'summary.pdf')
+    with tempfile.TemporaryDirectory() as scratch:
+        plot_path = os.path.join(scratch, 'plot.png')
+        _render(figure, plot_path)
+        Report.create_report(pdf_path, plot_path, title="BATCH SUMMARY", rows=table)
+    return csv_path, pdf_path
+
+
+# --- driver ---------------------------------------------------------------------
+
+def run_batch(directory, output_dir=None, workers=None, group='all', reports=True,
+              grid_step=DEFAULT_STEP, grid_tolerance=DEFAULT_TOLERANCE):
+    start = time.perf_counter()
+    report_dir = None
+    if reports:
+        report_dir = output_dir or os.path.join(directory, 'reports')
+        os.makedirs(report_dir, exist_ok=True)
+
+    jobs, results = [], []
+    for path in find_measurement_files(directory):
+        file_jobs, failed = _jobs(path)
+        jobs += file_jobs
+        results += failed
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [(path, names, pool.submit(evaluate_file, path, names, report_dir, grid_step, grid_tolerance))
+                   for path, names in jobs]
+        for path, names, future in futures:
+            try:
+                results += future.result()
+            except Exception as e:  # anything evaluate_file didn't expect - one file mustn't stop the batch
+                results += [MeasurementResult(os.path.basename(path), name, error=f"{type(e).__name__}: {e}")
+                            for name in (names or ['*'])]
+
+    evaluated = [r for r in results if r.grid is not None]
+    if group == 'file':
+        sources = dict.fromkeys(r.source for r in evaluated)
+        metrics = [stack_metrics(source, [r for r in evaluated if r.source == source], grid_step)
+                   for source in sources]
+    else:
+        metrics = [stack_metrics('all', evaluated, grid_step)]
+
+    summary = BatchSummary(results=results, metrics=metrics,
+                           skipped=[f"{r.source}: {r.name}: {r.error}" for r in results if r.error])
+    if reports:
+        write_summary(summary, report_dir)
+    summary.elapsed = time.perf_counter() - start
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate every saved measurement file in a directory.")
+    parser.add_argument('directory')
+    parser.add_argument('-o', '--output', default=None, help="report directory (default: <directory>/reports)")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--group', choices=('all', 'file'), default='all',
+                        help="stack all measurements together, or the ones of each file")
+    parser.add_argument('--no-reports', action='store_true', help="only print the results")
+    args = parser.parse_args()
+
+    summary = run_batch(args.directory, args.output, args.workers, args.group, reports=not args.no_reports)
+
+    print(f"{'measurement':<40} {'slope (µm/m)':>13} {'ptp (µm)':>9} {'straightness (µm)':>18}")
+    for r in summary.results:
+        if r.error is None:
+            print(f"{r.source + ': ' + r.name:<40} {_format(r.slope):>13} {_format(r.ptp):>9} "
+                  f"{_format(r.straightness):>18}")
+    for m in summary.metrics:
+        print(f"[{m.group}] {m.runs} run(s): straightness {_format(m.straightness)} µm, "
+              f"repeatability {_format(m.repeatability)} µm, flatness {_format(m.flatness)} µm")
+    for line in summary.skipped:
+        print(f"skipped {line}")
+    print(f"{len(summary.results)} measurement(s) in {summary.elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# bench_acquisition.py
+#
+# Throughput benchmark for the serial acquisition loop. Replays a synthetic
+# byte stream (or a recorded one, see --replay) through ReplaySerial and runs
+# both the previous line-at-a-time loop and Sampler.sample_data over it,
+# reporting sustained frames/s and CPU time per frame.
+#
+#     python bench_acquisition.py [--frames 200000] [--chunk 256] [--replay capture.bin]
+
+import argparse
+import contextlib
+import io
+import time
+
+import numpy as np
+import serial
+
+from acquisition import ReplaySerial, encode_frame
+from data_model import DataStore
+from Sampler import Sampler
+
+
+def synthesize_stream(n_frames, err_every=500, garbage_every=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.cumsum(rng.uniform(0.0, 0.002, n_frames)) + 0.25
+    adc = rng.integers(-2000, 2000, n_frames)
+    parts = []
+    for i in range(n_frames):
+        if err_every and i % err_every == err_every - 1:
+            parts.append(b'\x80\x06\x83ERR-15\x00\r0\n')
+        elif garbage_every and i % garbage_every == garbage_every - 1:
+            parts.append(b'\x12\x34\r\n')
+        else:
+            parts.append(encode_frame(x[i], adc[i]))
+    return b''.join(parts)
+
+
+def legacy_sample_data(sampler):
+    # The loop Sampler.sample_data used before the bulk-read parser: one
+    # read_until per frame, a print per frame and one (x, y) tuple per put().
+    while not sampler.stop_event.is_set():
+        try:
+            if sampler.ser.in_waiting > 0:
+                data = sampler.ser.read_until(b'\n')
+                print(data)
+                parts = data.split(b'\r')
+                if parts[0].startswith(b'\x80\x06\x83') and len(parts) > 1:
+                    xa = parts[0][3:-1].decode('ascii', errors='ignore')
+                    if 'ERR' in xa:
+                        continue
+                    cleaned_str = ''.join(filter(lambda x: x.isdigit() or x == '.', xa))
+                    xi = sampler.convert_x_data(cleaned_str)
+                    yi = sampler.convert_y_data(parts[1])
+                    if xi is None or yi is None:
+                        continue
+                    sampler.in_queue.put((xi, yi))
+        except serial.serialutil.SerialException:
+            sampler.stop_event.set()
+
+
+def count_samples(queue):
+    total = 0
+    while not queue.empty():
+        item = queue.get_nowait()
+        total += len(item[0]) if isinstance(item[0], np.ndarray) else 1
+    return total
+
+
+def run(label, loop, stream, chunk):
+    with contextlib.redirect_stdout(io.StringIO()):
+        sampler = Sampler(None, DataStore())
+    sampler.ser = ReplaySerial(stream, chunk_size=chunk)
+    sampler.stop_event.clear()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        loop(sampler)
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+    samples = count_samples(sampler.in_queue)
+    print(f"{label:<10} {samples:>9d} samples  {samples / wall:>12,.0f} frames/s  "
+          f"{1e6 * cpu / max(samples, 1):>8.2f} µs CPU/frame")
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--frames', type=int, default=200000)
+    parser.add_argument('--chunk', type=int, default=256, help="max bytes available per read")
+    parser.add_argument('--replay', help="recorded raw byte stream to replay instead of synthetic data")
+    args = parser.parse_args()
+
+    if args.replay:
+        with open(args.replay, 'rb') as f:
+            stream = f.read()
+    else:
+        stream = synthesize_stream(args.frames)
+    print(f"Replaying {len(stream)} bytes, {args.chunk} bytes per read")
+
+    legacy = run("legacy", legacy_sample_data, stream, args.chunk)
+    bulk = run("bulk", lambda sampler: sampler.sample_data(), stream, args.chunk)
+    if legacy != bulk:
+        print(f"WARNING: sample counts differ ({legacy} vs {bulk})")
+
+
+if __name__ == "__main__":
+    main()
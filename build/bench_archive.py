@@ -0,0 +1,86 @@
+# bench_archive.py
+#
+# Save/load benchmark: the binary archive against the CSV path, through
+# DataStore.save/load/import_measurements like the GUI uses them. The "csv
+# (list)" row is the previous CSV reader (map(float) into lists) for reference;
+# "re-save" saves the imported archive back over itself and checks the result.
+#
+#     python bench_archive.py [--measurements 10] [--points 200000] [--dir /tmp]
+
+import argparse
+import csv
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from data_model import DataStore, Measurement
+
+
+def legacy_load(path):
+    loaded = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            values = list(map(float, row[2:]))
+            original = loaded.setdefault(row[0], [[], []])
+            original[0 if row[1] == 'X' else 1] = values
+    return loaded
+
+
+def make_store(n_measurements, n_points, seed=0):
+    rng = np.random.default_rng(seed)
+    store = DataStore()
+    for i in range(n_measurements):
+        x = np.round(np.sort(rng.uniform(0.0, 1.0, n_points)), 4)
+        y = 5.0 * x + np.sin(30 * x) + rng.normal(0, 0.05, n_points)
+        name = f"axis {i}"
+        store.measurements[name] = Measurement(name=name, original=(x, y))
+        store._derive(name)
+    return store
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--measurements', type=int, default=10)
+    parser.add_argument('--points', type=int, default=200000)
+    parser.add_argument('--dir', default=None, help="where to write the temporary files")
+    args = parser.parse_args()
+
+    store = make_store(args.measurements, args.points)
+    names = list(store.measurements)
+    print(f"{args.measurements} measurements x {args.points} points")
+    print(f"{'format':<12} {'size (MB)':>10} {'save (s)':>9} {'open (s)':>9} {'open+import (s)':>16}")
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        for label, filename in (("csv", "session.csv"), ("archive", "session.lab")):
+            path = os.path.join(directory, filename)
+            save_time, _ = timed(lambda: store.save(path, names))
+            open_time = timed(lambda: DataStore().load(path))[0]
+            target = DataStore()
+            import_time = timed(lambda: target.import_measurements(target.load(path).measurements,
+                                                                   lambda name: None))[0]
+            size = os.path.getsize(path) / 1e6
+            print(f"{label:<12} {size:>10.1f} {save_time:>9.3f} {open_time:>9.3f} {import_time:>16.3f}")
+            if label == "csv":
+                legacy_time, _ = timed(lambda: legacy_load(path))
+                print(f"{'csv (list)':<12} {'':>10} {'':>9} {legacy_time:>9.3f}")
+            else:
+                # Save back over the file the measurements are still mapped from,
+                # with a filter applied - what "open, filter, save" does in the GUI.
+                target.update_filter(names[0], 21)
+                resave_time, _ = timed(lambda: target.save(path, names))
+                reloaded = DataStore().load(path).measurements
+                assert all(np.array_equal(reloaded[name].original[1], store.measurements[name].original[1])
+                           for name in names)
+                print(f"{'re-save':<12} {'':>10} {resave_time:>9.3f}   (over the open archive, verified)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# bench_batch.py
+#
+# Throughput of batch.py (measurements/s) against the number of worker
+# processes. Writes --files archives of --per-file synthetic measurements to a
+# temporary directory and runs the whole batch - evaluation and, unless
+# --no-reports, the PDFs - once per worker count.
+#
+#     python bench_batch.py [--files 8] [--per-file 4] [--points 200000] [--workers 1 2 4 8] [--no-reports]
+
+import argparse
+import os
+import tempfile
+
+import numpy as np
+
+from batch import run_batch
+from data_model import DataStore, Measurement
+
+
+def write_files(directory, n_files, per_file, n_points, seed=0):
+    rng = np.random.default_rng(seed)
+    profile = lambda x: 0.8 * np.sin(9 * x) + 0.3 * np.sin(23 * x)  # the "axis" every run sees
+    for i in range(n_files):
+        store = DataStore()
+        for j in range(per_file):
+            x = np.round(np.sort(rng.uniform(0.0, 1.0, n_points)), 4)
+            y = rng.normal(2.0, 1.0) * x + profile(x) + rng.normal(0, 0.05, n_points)
+            name = f"run {j}"
+            store.measurements[name] = Measurement(name=name, original=(x, y))
+        store.save(os.path.join(directory, f"axis-{i}.lab"), list(store.measurements), include_derived=False)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=8)
+    parser.add_argument('--per-file', type=int, default=4)
+    parser.add_argument('--points', type=int, default=200000)
+    parser.add_argument('--workers', type=int, nargs='+', default=None)
+    parser.add_argument('--no-reports', action='store_true')
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    workers = args.workers or sorted({1, 2, 4, 8, cores} & set(range(1, cores + 1)))
+    total = args.files * args.per_file
+    print(f"{total} measurements x {args.points} points, {cores} core(s), "
+          f"reports {'off' if args.no_reports else 'on'}")
+    print(f"{'workers':>8} {'time (s)':>9} {'meas/s':>8} {'speedup':>8}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_files(directory, args.files, args.per_file, args.points)
+        baseline = None
+        for count in workers:
+            summary = run_batch(directory, os.path.join(directory, f"reports-{count}"), workers=count,
+                                group='file', reports=not args.no_reports)
+            baseline = baseline or summary.elapsed
+            print(f"{count:>8} {summary.elapsed:>9.2f} {len(summary.results) / summary.elapsed:>8.1f} "
+                  f"{baseline / summary.elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# bench_reference.py
+#
+# Live throughput of PlotterQt.updater's data path (reference compensation,
+# ring window, live store, online analysis - everything but drawing) with no
+# reference, with the previous per-sample calc_reference loop and with
+# GridReference. The stream is at the sensor's 0.1mm resolution while the
+# reference grid is 1mm, so the "kept" column shows how much data each
+# variant lets through. The legacy loop is only run on --legacy-max samples.
+#
+#     python bench_reference.py [--samples 1000000] [--batch 64] [--reference-points 100000]
+
+import argparse
+import time
+
+import numpy as np
+
+from column_buffer import ColumnBuffer
+from data_model import DataStore, Measurement
+from online_analysis import OnlineAnalysis
+
+
+def legacy_calc_reference(measurement, new_data):
+    ref_x, ref_y = measurement.extended
+    x, y = new_data
+    index = np.where(np.isclose(ref_x, x, atol=1e-5))[0]
+    if len(index) == 0:
+        return None
+    return x, y - ref_y[index[0]]
+
+
+def legacy_compensate(measurement, x_batch, y_batch):
+    samples = [legacy_calc_reference(measurement, sample) for sample in zip(x_batch.tolist(), y_batch.tolist())]
+    samples = [sample for sample in samples if sample]
+    if not samples:
+        return x_batch[:0], y_batch[:0]
+    return np.array(samples).T
+
+
+def run(batches, compensate):
+    store = DataStore()
+    window = ColumnBuffer(2, capacity=100000, ring=True)
+    analysis = OnlineAnalysis()
+    kept = 0
+    start = time.perf_counter()
+    for x_batch, y_batch in batches:
+        if compensate is not None:
+            x_batch, y_batch = compensate(x_batch, y_batch)
+            if not len(x_batch):
+                continue
+        window.extend(x_batch, y_batch)
+        store.append_live(x_batch, y_batch)
+        analysis.update(x_batch, y_batch)
+        kept += len(x_batch)
+    return time.perf_counter() - start, kept
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', type=int, default=1000000)
+    parser.add_argument('--batch', type=int, default=64, help="samples per queued batch")
+    parser.add_argument('--reference-points', type=int, default=100000, help="1mm grid points in the reference")
+    parser.add_argument('--legacy-max', type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    length = args.reference_points * 0.001
+    store = DataStore()
+    ref_x = np.round(np.linspace(0.0, length, args.reference_points * 10), 4)
+    store.measurements['reference'] = Measurement('reference', (ref_x, 2.0 * ref_x + np.sin(ref_x)))
+    store.extend_data('reference')
+    measurement = store.measurements['reference']
+
+    # a run slightly longer than the reference, so some samples fall outside it
+    x = np.round(np.linspace(-0.01 * length, 1.01 * length, args.samples), 4)
+    y = 2.0 * x + np.sin(x) + rng.normal(0, 0.05, args.samples)
+    batches = [(x[i:i + args.batch], y[i:i + args.batch]) for i in range(0, args.samples, args.batch)]
+    legacy_batches = batches[:max(args.legacy_max // args.batch, 1)]
+
+    print(f"{args.samples} samples in batches of {args.batch}, reference {len(measurement.extended[0])} grid points")
+    print(f"{'variant':<22} {'samples':>9} {'kept':>7} {'samples/s':>12}")
+
+    def report(label, n, elapsed, kept):
+        print(f"{label:<22} {n:>9} {kept / n:>7.1%} {n / elapsed:>12.0f}")
+
+    report("no reference", args.samples, *run(batches, None))
+    n_legacy = sum(len(b[0]) for b in legacy_batches)
+    report("calc_reference loop", n_legacy, *run(legacy_batches, lambda xb, yb: legacy_compensate(measurement, xb, yb)))
+    reference = store.grid_reference('reference')
+    report("GridReference", args.samples, *run(batches, reference.subtract))
+    print(f"GridReference: {reference.compensated} compensated, {reference.out_of_range} out of range")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# bench_regrid.py
+#
+# Scaling benchmark for regrid.regrid() against the per-unique-x np.isclose
+# loop extend_data used before. Synthetic profiles from 10^3 to 10^6 samples
+# at the sensor's 0.1mm resolution, with many repeated x positions like a real
+# run. The old loop is O(N*U) and only run up to --legacy-max points; where both
+# run, the outputs are compared.
+#
+#     python bench_regrid.py [--sizes 1000 10000 100000 1000000] [--legacy-max 30000]
+
+import argparse
+import time
+
+import numpy as np
+
+from regrid import regrid
+
+
+def legacy_regrid(x_data, y_data):
+    unique_x_data = np.unique(x_data)
+    compressed_y_data = [np.mean(y_data[np.isclose(x_data, x, atol=1e-5)]) for x in unique_x_data]
+    new_x_data = np.arange(min(unique_x_data), max(unique_x_data) + 0.001, 0.001)
+    new_y_data = np.interp(new_x_data, unique_x_data, compressed_y_data)
+    return new_x_data, new_y_data
+
+
+def synthetic_profile(n, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.round(np.sort(rng.uniform(0.0, n * 2e-5, n)), 4)  # ~5 samples per 0.1mm position
+    y = 3.0 * x + 0.5 * np.sin(40 * x) + rng.normal(0, 0.05, n)
+    return x, y
+
+
+def timed(func, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--legacy-max', type=int, default=30000)
+    args = parser.parse_args()
+
+    print(f"{'points':>9} {'unique x':>9} {'grid':>8} {'regrid (ms)':>12} {'legacy (ms)':>12} {'max |diff|':>11}")
+    for n in args.sizes:
+        x, y = synthetic_profile(n)
+        new_time, (grid_x, grid_y) = timed(regrid, x, y)
+        legacy_text, diff_text = "-", "-"
+        if n <= args.legacy_max:
+            legacy_time, (legacy_x, legacy_y) = timed(legacy_regrid, x, y, repeat=1)
+            legacy_text = f"{1e3 * legacy_time:.1f}"
+            diff_text = f"{np.max(np.abs(grid_y - legacy_y)):.1e}" if len(legacy_x) == len(grid_x) else "shape!"
+        print(f"{n:>9d} {len(np.unique(x)):>9d} {len(grid_x):>8d} {1e3 * new_time:>12.1f} {legacy_text:>12} {diff_text:>11}")
+
+
+if __name__ == "__main__":
+    main()
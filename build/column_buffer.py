@@ -0,0 +1,96 @@
+# column_buffer.py
+#
+# Preallocated float64 column storage for live acquisition data, replacing the
+# lists of Python floats/tuples the sampler output used to be appended to.
+#
+# Two modes:
+#   - growable (default): keeps every sample, capacity doubles when full, so
+#     appends are amortised O(1) and memory is 8 bytes per value.
+#   - ring: fixed capacity, keeps only the newest `capacity` samples. Each
+#     sample is written twice (at i and i + capacity), so the current window
+#     is always one contiguous slice and columns() never has to copy - the
+#     live Line2D can be handed the views directly.
+
+import numpy as np
+
+
+class ColumnBuffer:
+    def __init__(self, n_columns=2, capacity=4096, ring=False):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.n_columns = n_columns
+        self.ring = ring
+        self._capacity = capacity
+        self._storage = np.empty((n_columns, 2 * capacity if ring else capacity), dtype=np.float64)
+        self._total = 0  # samples appended since the last clear(), including overwritten ones
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def total(self):
+        return self._total
+
+    def __len__(self):
+        return min(self._total, self._capacity) if self.ring else self._total
+
+    def clear(self):
+        self._total = 0
+
+    def append(self, *values):
+        self.extend(*([value] for value in values))
+
+    def extend(self, *columns):
+        if len(columns) != self.n_columns:
+            raise ValueError(f"expected {self.n_columns} columns, got {len(columns)}")
+        columns = [np.asarray(column, dtype=np.float64) for column in columns]
+        count = len(columns[0])
+        if any(len(column) != count for column in columns):
+            raise ValueError("columns must have equal length")
+        if count == 0:
+            return
+        if self.ring:
+            self._extend_ring(columns, count)
+        else:
+            self._reserve(self._total + count)
+            for i, column in enumerate(columns):
+                self._storage[i, self._total:self._total + count] = column
+            self._total += count
+
+    def _reserve(self, size):
+        if size <= self._capacity:
+            return
+        new_capacity = max(size, 2 * self._capacity)
+        storage = np.empty((self.n_columns, new_capacity), dtype=np.float64)
+        storage[:, :self._total] = self._storage[:, :self._total]
+        self._storage = storage
+        self._capacity = new_capacity
+
+    def _extend_ring(self, columns, count):
+        capacity = self._capacity
+        if count > capacity:  # only the newest `capacity` samples survive anyway
+            skipped = count - capacity
+            columns = [column[skipped:] for column in columns]
+            self._total += skipped
+            count = capacity
+        head = self._total % capacity
+        first = min(count, capacity - head)  # up to the wrap point, the rest goes to the front
+        for i, column in enumerate(columns):
+            row = self._storage[i]
+            row[head:head + first] = column[:first]
+            row[head + capacity:head + capacity + first] = column[:first]
+            if first < count:
+                row[:count - first] = column[first:]
+                row[capacity:capacity + count - first] = column[first:]
+        self._total += count
+
+    def columns(self):
+        """Zero-copy views of the stored samples, oldest first. Views are only
+        valid until the next extend()/clear() - copy them to keep a snapshot."""
+        size = len(self)
+        start = self._total % self._capacity if self.ring and self._total >= self._capacity else 0
+        return tuple(self._storage[i, start:start + size] for i in range(self.n_columns))
+
+    def snapshot(self):
+        return tuple(column.copy() for column in self.columns())
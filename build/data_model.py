@@ -6,20 +6,27 @@
 # dialog or touches a widget - callers (gui_qt.py) catch ValueError/OSError and
 # decide how to present them.
 
-import csv
+import os
 import unicodedata
 from dataclasses import dataclass, field
+from datetime import datetime
 from queue import Queue
 from typing import Callable, Optional
 
 import numpy as np
 from scipy.signal import savgol_filter
 
+import archive
+import recorder
+from column_buffer import ColumnBuffer
+from reference import GridReference
+from regrid import DEFAULT_STEP, DEFAULT_TOLERANCE, regrid
+
 
 @dataclass
 class Measurement:
     name: str
-    original: tuple  # (list[float], list[float])
+    original: tuple  # (x, y) float64 arrays, memory-mapped when loaded from an archive
     extended: Optional[tuple] = None
     detrended: Optional[tuple] = None
     coefficients: Optional[tuple] = None
@@ -27,6 +34,14 @@ class Measurement:
     filtered: Optional[tuple] = None  # transient - recomputed on demand, never saved/loaded
 
 
+@dataclass
+class Derived:
+    extended: tuple
+    detrended: Optional[tuple]
+    coefficients: Optional[tuple]
+    results: dict
+
+
 @dataclass
 class SaveResult:
     saved: list
@@ -45,23 +60,149 @@ class ImportResult:
     skipped: list
 
 
+# --- pure numeric functions: no DataStore state, safe to run on a worker thread/process --
+
+FILTER_POLYORDER = 2  # quadratic local fit - a reasonable default for smoothing profile data
+
+
+def filter_grid(extended, window_length, polyorder=FILTER_POLYORDER):
+    # Savitzky-Golay on the uniformly gridded `extended` data (not `original`,
+    # which can be irregularly spaced / contain duplicate x - meaningless as input
+    # to a filter that assumes uniform sampling). window_length counts grid
+    # points, so the window spans window_length * grid_step of travel.
+    # Returns (x, y_filtered), or None if filtering is off / not possible.
+    if window_length <= 0:
+        return None
+    x, y = extended
+
+    window_length = max(int(window_length), polyorder + 1)
+    if window_length % 2 == 0:
+        window_length += 1
+    window_length = min(window_length, len(y) if len(y) % 2 else len(y) - 1)
+
+    if window_length <= polyorder:
+        return None  # not enough points to filter meaningfully
+
+    return x, savgol_filter(y, window_length, polyorder)
+
+
+def filter_measurement(original, extended, window_length,
+                       grid_step=DEFAULT_STEP, grid_tolerance=DEFAULT_TOLERANCE):
+    # filter_grid() for a measurement that may not have been regridded yet.
+    if extended is None:
+        extended = regrid(original[0], original[1], grid_step, grid_tolerance)
+    return filter_grid(extended, window_length)
+
+
+def derive(original, extended=None, coefficients=None, results=None,
+           grid_step=DEFAULT_STEP, grid_tolerance=DEFAULT_TOLERANCE):
+    # Everything add/import needs on top of the original data; whatever is
+    # passed in already (e.g. from an archive) is reused rather than recomputed.
+    if extended is None:
+        if len(original[0]) == 0:
+            raise ValueError("Dataset has no data points.")
+        extended = regrid(original[0], original[1], grid_step, grid_tolerance)
+    x_data, y_data = extended
+    if coefficients is None and len(x_data) >= 2:  # polyfit needs at least 2 points for a linear fit
+        coefficients = tuple(np.polyfit(x_data, y_data, 1))
+    detrended = None
+    if coefficients is not None:
+        a, b = coefficients
+        detrended = (x_data, y_data - (a * x_data + b))
+    results = dict(results or {})
+    results.setdefault('ptp', np.ptp(y_data))  # raw Y range, linear trend included
+    return Derived(extended=extended, detrended=detrended, coefficients=coefficients, results=results)
+
+
 class DataStore:
-    def __init__(self):
-        self.queue = Queue()  # Sampler pushes (x, y) tuples in here directly
-        self.live_data = []
+    def __init__(self, grid_step=DEFAULT_STEP, grid_tolerance=DEFAULT_TOLERANCE):
+        self.grid_step = grid_step  # spacing of the uniform `extended` grid (m)
+        self.grid_tolerance = grid_tolerance  # x values closer than this are averaged into one point
+        self.queue = Queue()  # Sampler pushes (x_array, y_array) batches in here directly
+        self.live_data = ColumnBuffer(2)  # every (x, y) sample since the last clear, float64 columns
+        self.recording = None  # Recorder while recording: samples go to disk instead of live_data
         self.measurements = {}
+        # Called with a path before save() replaces it, so whoever caches arrays
+        # (plot state, derived-data cache) can drop the ones mapped from it.
+        self.release_hooks = []
 
     # --- live data (acquisition buffer, not yet a named Measurement) ----------
 
+    def append_live(self, x, y):
+        if self.recording is not None:
+            self.recording.append(x, y)
+        else:
+            self.live_data.extend(x, y)
+
     def clear_live_data(self):
-        self.live_data = []
+        self.live_data.clear()
+        if self.recording is not None:  # sampling may still be running - keep recording into a fresh file
+            directory = os.path.dirname(self.recording.path)
+            self.stop_recording()
+            self.start_recording(directory)
 
     def get_live_data(self):
-        return self.live_data
+        if self.recording is not None:
+            self.recording.flush()
+            x, y, _ = recorder.read_recording(self.recording.path)
+            return x, y
+        return self.live_data.columns()
 
     def get_number_live_data(self):
+        if self.recording is not None:
+            return self.recording.count
         return len(self.live_data)
 
+    # --- spill-to-disk recording -----------------------------------------------
+
+    def start_recording(self, directory=recorder.RECORDING_DIR):
+        if self.recording is not None:
+            return
+        os.makedirs(directory, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        path = os.path.join(directory, f"recording-{stamp}{recorder.RECORDING_SUFFIX}")
+        self.recording = recorder.Recorder(path)
+        if len(self.live_data):  # samples taken before recording was switched on go to the file too
+            self.recording.append(*self.live_data.columns())
+            self.live_data.clear()
+
+    def recording_problem(self):
+        """Why the active recording is incomplete, or None if it isn't."""
+        if self.recording is None:
+            return None
+        if self.recording.error is not None:
+            return f"Recording stopped after a write error ({self.recording.error})."
+        if self.recording.dropped:
+            return f"{self.recording.dropped} samples were dropped because the disk couldn't keep up."
+        return None
+
+    def stop_recording(self, keep_file=False):
+        if self.recording is None:
+            return
+        self.recording.close()
+        if not keep_file:
+            os.remove(self.recording.path)
+        self.recording = None
+
+    def recover_recording(self, path):
+        """Turns a recording left behind by an interrupted session into a
+        Measurement named after its start time, then deletes the file.
+        Returns None (and still deletes it) if it held no samples."""
+        x, y, complete = recorder.read_recording(path)
+        measurement = None
+        if len(x):
+            base = "recovered " + os.path.basename(path)[len("recording-"):-len(recorder.RECORDING_SUFFIX)][:15]
+            name, suffix = base, 2
+            while name in self.measurements:
+                name, suffix = f"{base} ({suffix})", suffix + 1
+            measurement = Measurement(name=name, original=(x, y))
+            self.measurements[name] = measurement
+            self._derive(name)
+            if not complete:
+                print(f"{os.path.basename(path)}: torn last chunk ignored")
+        os.remove(path)
+        return measurement
+
     # --- measurement lifecycle -------------------------------------------------
 
     @staticmethod
@@ -77,17 +218,25 @@ class DataStore:
             raise ValueError(f"Name '{name}' already exists.")
         return name
 
-    def add_measurement(self, name):
-        if not self.live_data:
+    def add_measurement(self, name, derive=True, allow_incomplete=False):
+        # derive=False leaves extended/detrended/results for the caller to fill
+        # in (e.g. on a worker thread, then apply_derived()). An incomplete
+        # recording (see recording_problem) is only added with allow_incomplete.
+        if not self.get_number_live_data():
             raise ValueError("No live data captured yet - start sampling first.")
+        problem = self.recording_problem()
+        if problem and not allow_incomplete:
+            raise ValueError(f"{problem} The recorded data is incomplete.")
         name = self._validate_name(name, self.measurements)
 
-        x_data, y_data = zip(*self.live_data)
-        measurement = Measurement(name=name, original=(list(x_data), list(y_data)))
+        if self.recording is not None:
+            original = self.get_live_data()
+        else:
+            original = self.live_data.snapshot()
+        measurement = Measurement(name=name, original=original)
         self.measurements[name] = measurement
-        self.extend_data(name)
-        self.remove_trend(name)
-        self.calc_ptp(name)
+        if derive:
+            self._derive(name)
         return measurement
 
     def remove_measurement(self, name):
@@ -107,32 +256,14 @@ class DataStore:
 
     # --- numeric processing (ported from Data.py, with the guards added earlier) --
 
-    _FILTER_POLYORDER = 2  # quadratic local fit - a reasonable default for smoothing profile data
-
     def update_filter(self, name, window_length):
-        # Savitzky-Golay on the uniform 1mm-gridded `extended` data (not `original`,
-        # which can be irregularly spaced / contain duplicate x - meaningless as input
-        # to a filter that assumes uniform sampling). window_length is in mm/points
-        # since the grid step is 1mm, so it has a direct physical meaning.
         measurement = self.measurements[name]
         if window_length <= 0:
             measurement.filtered = None
             return
         if measurement.extended is None:
             self.extend_data(name)
-        x, y = measurement.extended
-
-        window_length = max(int(window_length), self._FILTER_POLYORDER + 1)
-        if window_length % 2 == 0:
-            window_length += 1
-        window_length = min(window_length, len(y) if len(y) % 2 else len(y) - 1)
-
-        if window_length <= self._FILTER_POLYORDER:
-            measurement.filtered = None  # not enough points to filter meaningfully
-            return
-
-        y_filtered = savgol_filter(y, window_length, self._FILTER_POLYORDER)
-        measurement.filtered = (x, y_filtered)
+        measurement.filtered = filter_grid(measurement.extended, window_length)
 
     def extend_data(self, name):
         measurement = self.measurements.get(name)
@@ -140,15 +271,10 @@ class DataStore:
             return
         if measurement.extended is not None:
             return
-        x_data = np.array(measurement.original[0])
-        y_data = np.array(measurement.original[1])
-        if len(x_data) == 0:
+        if len(measurement.original[0]) == 0:
             raise ValueError(f"Dataset '{name}' has no data points.")
-        unique_x_data = np.unique(x_data)  # remove duplicate x values, interpolation would fail otherwise
-        compressed_y_data = [np.mean(y_data[np.isclose(x_data, x, atol=1e-5)]) for x in unique_x_data]
-        new_x_data = np.arange(min(unique_x_data), max(unique_x_data) + 0.001, 0.001)
-        new_y_data = np.interp(new_x_data, unique_x_data, compressed_y_data)
-        measurement.extended = (new_x_data, new_y_data)
+        measurement.extended = regrid(measurement.original[0], measurement.original[1],
+                                      self.grid_step, self.grid_tolerance)
 
     def remove_trend(self, name):
         measurement = self.measurements.get(name)
@@ -164,14 +290,33 @@ class DataStore:
             measurement.detrended = (x_data, y_data)
             measurement.coefficients = (a, b)
 
+    def _derive(self, name):
+        # Fills in whatever derived data is missing. An archive load brings
+        # extended/coefficients/results along, so only the (small, gridded)
+        # detrended curve is rebuilt and the original data stays unread.
+        measurement = self.measurements[name]
+        try:
+            self.apply_derived(name, derive(measurement.original, measurement.extended, measurement.coefficients,
+                                            measurement.results, self.grid_step, self.grid_tolerance))
+        except ValueError as e:
+            raise ValueError(f"Dataset '{name}': {e}") from e
+
+    def apply_derived(self, name, derived):
+        measurement = self.measurements.get(name)
+        if measurement is None:
+            return
+        measurement.extended = derived.extended
+        measurement.detrended = derived.detrended
+        measurement.coefficients = derived.coefficients
+        measurement.results.update(derived.results)
+
     def calc_trend(self, name):
         measurement = self.measurements.get(name)
         if measurement is None:
             return None, None
         if measurement.extended is None:
             self.extend_data(name)
-        x_data = np.array(measurement.extended[0])
-        y_data = np.array(measurement.extended[1])
+        x_data, y_data = measurement.extended
         if len(x_data) < 2:  # polyfit needs at least 2 points for a linear fit
             return None, None
         a, b = np.polyfit(x_data, y_data, 1)
@@ -183,8 +328,7 @@ class DataStore:
             return
         if measurement.extended is None:
             self.extend_data(name)
-        y_data = np.array(measurement.extended[1])
-        measurement.results['ptp'] = np.ptp(y_data)  # raw Y range, linear trend included
+        measurement.results['ptp'] = np.ptp(measurement.extended[1])  # raw Y range, linear trend included
 
     def compare_slope(self, name1, name2):
         if name1 not in self.measurements or name2 not in self.measurements:
@@ -200,65 +344,102 @@ class DataStore:
         a2, _ = m2.coefficients
         return a1, a2
 
-    def calc_reference(self, reference_name, new_data):
+    def grid_reference(self, reference_name):
+        """GridReference over the extended data of `reference_name`, or None.
+        Builds a new index (O(N) uniformity check) - callers keep it, see
+        PlotterQt._live_reference."""
         measurement = self.measurements.get(reference_name)
-        if measurement is None or measurement.extended is None:
-            return None
-        ref_x, ref_y = measurement.extended
-        x, y = new_data
-
-        index = np.where(np.isclose(ref_x, x, atol=1e-5))[0]
-        if len(index) == 0:
+        if measurement is None:
             return None
-        return x, y - ref_y[index[0]]
+        if measurement.extended is None:
+            self.extend_data(measurement.name)
+        return GridReference(*measurement.extended, tolerance=self.grid_tolerance)
 
-    # --- persistence: original data only, filtered/extended are never saved/loaded --
+    # --- persistence ------------------------------------------------------------
+    # ".csv": original data only, one row per axis (the format older versions read).
+    # Anything else: binary archive (archive.py) with the derived extended/
+    # coefficients/results kept, loaded lazily via memory mapping. filtered is
+    # never saved.
 
-    def save(self, path, names):
+    def save(self, path, names, include_derived=True):
         selected = {name: self.measurements[name] for name in names if name in self.measurements}
-        skipped_empty = [name for name, m in selected.items() if not m.original[0]]
+        skipped_empty = [name for name, m in selected.items() if len(m.original[0]) == 0]
         for name in skipped_empty:
             del selected[name]
 
-        with open(path, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            for name, measurement in selected.items():
-                x_orig, y_orig = measurement.original
-                writer.writerow([name, 'X'] + list(x_orig))
-                writer.writerow([name, 'Y'] + list(y_orig))
+        if path.lower().endswith('.csv'):
+            archive.write_csv(path, selected.values())
+        else:
+            self._release_mapping(path)
+            temp_path = path + '.tmp'  # an interrupted save must not clobber the previous file
+            try:
+                with archive.ArchiveWriter(temp_path) as writer:
+                    for measurement in selected.values():
+                        writer.add_measurement(measurement, include_derived)
+                os.replace(temp_path, path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
 
         return SaveResult(saved=list(selected.keys()), skipped_empty=skipped_empty)
 
+    def _release_mapping(self, path):
+        # Measurements loaded from `path` are still memory-mapped from it - copy
+        # them into memory and have every other holder let go before the file is
+        # replaced (Windows refuses to replace a mapped file, elsewhere they'd
+        # silently keep the old inode).
+        for measurement in self.measurements.values():
+            self._copy_mapped(measurement, path)
+        for hook in self.release_hooks:
+            hook(path)
+        if archive.is_mapped(path):
+            raise OSError(f"{os.path.basename(path)} is still in use (a calculation may still be running) - "
+                          "try again or save under another name.")
+
+    @staticmethod
+    def _copy_mapped(measurement, path):
+        # Separate function so no local outlives the copy and keeps the old
+        # arrays - and with them the mapping - alive for the is_mapped check.
+        for attr in ('original', 'extended', 'detrended', 'filtered'):
+            arrays = getattr(measurement, attr)
+            if arrays is not None and archive.uses_file(arrays, path):
+                setattr(measurement, attr, tuple(np.array(a) for a in arrays))
+
     def load(self, path):
+        if archive.is_archive(path):
+            return self._load_archive(path)
+
         skipped_rows = 0
         loaded = {}
-        with open(path, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                if len(row) < 3 or row[1] not in ('X', 'Y'):  # only original data is ever loaded
-                    skipped_rows += 1
-                    continue
-                name = row[0]
-                if name not in loaded:
-                    loaded[name] = Measurement(name=name, original=([], []))
-                try:
-                    values = list(map(float, row[2:]))
-                except ValueError:
-                    skipped_rows += 1
-                    continue
-                if row[1] == 'X':
-                    loaded[name].original = (values, loaded[name].original[1])
-                else:
-                    loaded[name].original = (loaded[name].original[0], values)
+        for row in archive.iter_csv(path):
+            if row is None:
+                skipped_rows += 1
+                continue
+            name, axis, values = row
+            if name not in loaded:
+                loaded[name] = Measurement(name=name, original=(np.empty(0), np.empty(0)))
+            if axis == 'X':
+                loaded[name].original = (values, loaded[name].original[1])
+            else:
+                loaded[name].original = (loaded[name].original[0], values)
 
         return LoadResult(measurements=loaded, skipped_rows=skipped_rows)
 
-    def import_measurements(self, loaded, resolve_conflict: Callable[[str], Optional[str]]):
+    @staticmethod
+    def _load_archive(path):
+        loaded = {}
+        for name, entry in archive.read_archive(path).items():
+            loaded[name] = Measurement(name=name, original=entry['original'], extended=entry['extended'],
+                                       coefficients=entry['coefficients'], results=entry['results'])
+        return LoadResult(measurements=loaded, skipped_rows=0)
+
+    def import_measurements(self, loaded, resolve_conflict: Callable[[str], Optional[str]], derive=True):
         loaded_names = []
         skipped_names = []
 
         for name, measurement in loaded.items():
-            if not measurement.original[0] or not measurement.original[1]:
+            if len(measurement.original[0]) == 0 or len(measurement.original[1]) == 0:
                 skipped_names.append(name)
                 continue
 
@@ -272,9 +453,8 @@ class DataStore:
 
             try:
                 self.measurements[name] = measurement
-                self.extend_data(name)
-                self.remove_trend(name)
-                self.calc_ptp(name)
+                if derive:
+                    self._derive(name)
                 loaded_names.append(name)
             except Exception:
                 self.measurements.pop(name, None)
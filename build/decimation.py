@@ -0,0 +1,107 @@
+# decimation.py
+#
+# Min/max level-of-detail decimation for plotting long series. A screen can't
+# show more than a couple of points per horizontal pixel, so instead of handing
+# matplotlib 10^6 points we keep, for every bucket of consecutive samples, the
+# sample with the lowest and the one with the highest y (in their original
+# order). Peaks survive at every zoom level, so the ptp you read off the plot
+# is the ptp of the data.
+#
+# MinMaxPyramid precomputes these buckets at sizes factor^1, factor^2, ... for
+# a series that is plotted repeatedly (saved data) and picks the level that
+# matches the axes' pixel width on every draw. minmax_decimate() is the one-shot
+# version for data that changes every frame (the live window), and for a
+# zoomed-in view of a series whose x isn't sorted.
+
+import numpy as np
+
+
+def _reduce(indices, values, factor, pick):
+    # Groups `factor` consecutive candidate indices and keeps the one whose value
+    # `pick` (np.argmin/np.argmax) selects. A short last group is padded with its
+    # own last index, which can't change the result.
+    pad = (-len(indices)) % factor
+    if pad:
+        indices = np.concatenate([indices, np.repeat(indices[-1], pad)])
+    groups = indices.reshape(-1, factor)
+    return groups[np.arange(len(groups)), pick(values[groups], axis=1)]
+
+
+def _interleave(i_min, i_max):
+    # Per bucket, emit the min and max sample in the order they were measured.
+    return np.stack([np.minimum(i_min, i_max), np.maximum(i_min, i_max)], axis=1).ravel()
+
+
+def minmax_decimate(x, y, pixels):
+    """Reduces (x, y) to at most ~2 * pixels points, keeping each bucket's
+    extremes. Returns the input unchanged if it is already small enough."""
+    n = len(y)
+    bucket = n // max(int(pixels), 1)
+    if bucket < 2:
+        return x, y
+    y = np.asarray(y)
+    indices = np.arange(n)
+    idx = _interleave(_reduce(indices, y, bucket, np.argmin), _reduce(indices, y, bucket, np.argmax))
+    return np.asarray(x)[idx], y[idx]
+
+
+class MinMaxPyramid:
+    """Min/max decimation levels for one (x, y) series. If x is sorted (the
+    regridded/detrended/filtered data) select() clips to the visible x range
+    by binary search; raw data in acquisition order (jitter, back-and-forth
+    travel) is masked by x instead and the visible samples decimated on the fly."""
+
+    def __init__(self, x, y, factor=4, min_buckets=256):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.factor = factor
+        self.is_sorted = bool(len(self.x) < 2 or np.all(self.x[1:] >= self.x[:-1]))
+        self.x_range = (float(self.x.min()), float(self.x.max())) if len(self.x) else (0.0, 0.0)
+        self.levels = []  # (bucket size, interleaved min/max indices), finest first
+
+        n = len(self.y)
+        i_min = i_max = np.arange(n)
+        bucket = 1
+        while n // (bucket * factor) >= min_buckets:
+            i_min = _reduce(i_min, self.y, factor, np.argmin)
+            i_max = _reduce(i_max, self.y, factor, np.argmax)
+            bucket *= factor
+            self.levels.append((bucket, _interleave(i_min, i_max)))
+
+    def __len__(self):
+        return len(self.x)
+
+    def select(self, pixels, x_min=None, x_max=None):
+        """Returns the (x, y) to draw for an axes `pixels` wide showing
+        [x_min, x_max]: the coarsest level that still has a point pair per
+        pixel, or the raw samples when zoomed in far enough."""
+        n = len(self.x)
+        lo, hi = 0, n
+        zoomed = x_min is not None and x_max is not None and (x_min > self.x_range[0] or x_max < self.x_range[1])
+        if zoomed and not self.is_sorted:
+            return self._select_unsorted(pixels, x_min, x_max)
+        if self.is_sorted and x_min is not None and x_max is not None:
+            lo = max(int(np.searchsorted(self.x, x_min, 'left')) - 1, 0)
+            hi = min(int(np.searchsorted(self.x, x_max, 'right')) + 1, n)
+        if hi <= lo:
+            return self.x[:0], self.y[:0]
+
+        visible = hi - lo
+        for bucket, idx in reversed(self.levels):
+            if visible // bucket >= pixels:
+                idx = idx[2 * (lo // bucket):2 * ((hi - 1) // bucket + 1)]
+                idx = idx[(idx > lo) & (idx < hi - 1)]
+                idx = np.concatenate(([lo], idx, [hi - 1]))  # keep the end points so the x extent is exact
+                return self.x[idx], self.y[idx]
+        return self.x[lo:hi], self.y[lo:hi]
+
+    def _select_unsorted(self, pixels, x_min, x_max):
+        # O(n) per zoom, but only the visible samples are decimated. Their
+        # neighbours are kept too so a line leaves the view instead of
+        # stopping at the edge.
+        inside = (self.x >= x_min) & (self.x <= x_max)
+        visible = inside.copy()
+        visible[1:] |= inside[:-1]
+        visible[:-1] |= inside[1:]
+        idx = np.flatnonzero(visible)
+        return minmax_decimate(self.x[idx], self.y[idx], pixels)
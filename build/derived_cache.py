@@ -0,0 +1,84 @@
+# derived_cache.py
+#
+# Memory-bounded LRU cache for derived data (regridded/detrended/filtered
+# curves). Keys are (measurement, operation, parameters) tuples; the size of an
+# entry is the total nbytes of the arrays in it, so the cap is in bytes rather
+# than in entries - one 10^7 point curve weighs as much as a thousand small ones.
+#
+# Not thread-safe: only ever touched from the thread that owns it (the GUI
+# thread in derived_qt.py).
+
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def estimate_nbytes(value):
+    """Bytes held by the numpy arrays in `value` (nested tuples/lists/dicts and
+    dataclass-like objects with __dict__); everything else counts as 64."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(estimate_nbytes(item) for item in value)
+    if isinstance(value, dict):
+        return sum(estimate_nbytes(item) for item in value.values())
+    if hasattr(value, '__dict__'):
+        return estimate_nbytes(vars(value))
+    return 64
+
+
+class LRUCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (value, nbytes), least recently used first
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value):
+        self.pop(key)
+        size = estimate_nbytes(value)
+        if size > self.max_bytes:
+            return  # would evict everything else and still not fit
+        self._entries[key] = (value, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.nbytes -= evicted
+
+    def pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self.nbytes -= entry[1]
+        return entry[0]
+
+    def items(self):
+        """(key, value) pairs, least recently used first; doesn't count as use."""
+        return [(key, entry[0]) for key, entry in self._entries.items()]
+
+    def invalidate(self, predicate):
+        """Drops every entry whose key satisfies `predicate`."""
+        for key in [key for key in self._entries if predicate(key)]:
+            self.pop(key)
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
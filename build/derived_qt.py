@@ -0,0 +1,158 @@
+# derived_qt.py
+#
+# Runs the numeric work behind a measurement (regrid/detrend/ptp on add and
+# import, the Savitzky-Golay filter on every slider move) off the GUI thread.
+# Jobs are the pure functions in data_model.py and go to a thread pool -
+# numpy/scipy release the GIL for the heavy parts - or, above
+# process_threshold points, to a process pool. Results come back to
+# the GUI thread through a queued signal and are only applied there, so
+# DataStore/Measurement are never touched from a worker.
+#
+# Each (measurement, operation) has a generation counter: a new request bumps
+# it and cancels the previous job if it hasn't started yet. A job that finishes
+# after it was superseded is still cached (its result is valid for its own
+# parameters) but not applied, so dragging the filter slider only ever shows
+# the latest window. Filter results are kept in an LRU capped in bytes, so
+# moving back to a window seen before is instant.
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+import archive
+import data_model
+from derived_cache import DEFAULT_MAX_BYTES, LRUCache
+
+
+class DerivedDataService(QObject):
+    DERIVE = "derive"
+    FILTER = "filter"
+
+    result_ready = pyqtSignal(str, str)  # measurement name, operation - emitted on the GUI thread
+    failed = pyqtSignal(str, str, str)  # measurement name, operation, message
+    _finished = pyqtSignal(object)  # worker -> GUI thread hand-over
+
+    def __init__(self, data_holder, max_workers=None, cache_bytes=DEFAULT_MAX_BYTES, process_threshold=2_000_000):
+        super().__init__()
+        self.data_holder = data_holder
+        self.cache = LRUCache(cache_bytes)
+        self.process_threshold = process_threshold  # points; bigger jobs go to a process pool
+        self._threads = ThreadPoolExecutor(max_workers, thread_name_prefix="derived")
+        self._processes = None  # started on first big job - most sessions never need it
+        self._max_workers = max_workers
+        self._generation = {}  # (id(measurement), operation) -> latest request number
+        self._pending = {}  # (id(measurement), operation) -> Future of the latest request
+        self._finished.connect(self._deliver)
+        data_holder.release_hooks.append(self._release_mapping)
+
+    # --- requests (GUI thread) ---------------------------------------------------
+
+    def request_derive(self, name):
+        measurement = self.data_holder.measurements[name]
+        self._submit(measurement, self.DERIVE, None, data_model.derive,
+                     measurement.original, measurement.extended, measurement.coefficients, measurement.results,
+                     self.data_holder.grid_step, self.data_holder.grid_tolerance)
+
+    def request_filter(self, name, window_length):
+        measurement = self.data_holder.measurements[name]
+        window_length = int(window_length)
+        if window_length <= 0:
+            self._cancel(measurement, self.FILTER)
+            measurement.filtered = None
+            self.result_ready.emit(name, self.FILTER)
+            return
+        cached = self.cache.get(self._cache_key(measurement, self.FILTER, window_length))
+        if cached is not None:
+            self._cancel(measurement, self.FILTER)
+            measurement.filtered = cached
+            self.result_ready.emit(name, self.FILTER)
+            return
+        # The filter may be asked for before the derive job has produced `extended`;
+        # otherwise the raw series isn't needed (and isn't pickled for a process pool).
+        original = measurement.original if measurement.extended is None else None
+        self._submit(measurement, self.FILTER, window_length, data_model.filter_measurement,
+                     original, measurement.extended, window_length,
+                     self.data_holder.grid_step, self.data_holder.grid_tolerance)
+
+    def forget(self, measurement):
+        """Drops pending jobs and cached results of a removed measurement -
+        its id() may be reused by the next object."""
+        for operation in (self.DERIVE, self.FILTER):
+            self._cancel(measurement, operation)
+            self._generation.pop((id(measurement), operation), None)
+        self.cache.invalidate(lambda key: key[0] == id(measurement))
+
+    def _release_mapping(self, path):  # DataStore.release_hooks
+        for key, value in self.cache.items():
+            if archive.uses_file(value, path):
+                self.cache.pop(key)
+
+    def is_pending(self, measurement, operation=DERIVE):
+        future = self._pending.get((id(measurement), operation))
+        return future is not None and not future.done()
+
+    def shutdown(self):
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+
+    # --- internals ----------------------------------------------------------------
+
+    @staticmethod
+    def _cache_key(measurement, operation, parameters):
+        return id(measurement), operation, parameters
+
+    def _cancel(self, measurement, operation):
+        slot = (id(measurement), operation)
+        self._generation[slot] = self._generation.get(slot, 0) + 1
+        future = self._pending.pop(slot, None)
+        if future is not None:
+            future.cancel()  # only succeeds if it hasn't started; otherwise its result is ignored
+
+    def _executor(self, measurement):
+        points = len(measurement.extended[0]) if measurement.extended is not None else len(measurement.original[0])
+        if points < self.process_threshold:
+            return self._threads
+        if self._processes is None:
+            self._processes = ProcessPoolExecutor(self._max_workers)
+        return self._processes
+
+    def _submit(self, measurement, operation, parameters, function, *args):
+        self._cancel(measurement, operation)
+        slot = (id(measurement), operation)
+        generation = self._generation[slot]
+        future = self._executor(measurement).submit(function, *args)
+        self._pending[slot] = future
+        # The callback runs on whichever thread completes the future; the signal
+        # queues the actual hand-over onto the GUI thread.
+        future.add_done_callback(
+            lambda done: self._finished.emit((measurement, operation, parameters, generation, done)))
+
+    def _deliver(self, job):
+        measurement, operation, parameters, generation, future = job
+        if future.cancelled():
+            return
+        slot = (id(measurement), operation)
+        current = self._generation.get(slot) == generation
+        if current:
+            self._pending.pop(slot, None)
+        if self.data_holder.measurements.get(measurement.name) is not measurement:
+            return  # removed while the job was running
+
+        error = future.exception()
+        if error is not None:
+            if current:
+                self.failed.emit(measurement.name, operation, str(error))
+            return
+        result = future.result()
+
+        if operation == self.FILTER:
+            if result is not None:
+                self.cache.put(self._cache_key(measurement, operation, parameters), result)
+            if current:
+                measurement.filtered = result
+        elif current:
+            self.data_holder.apply_derived(measurement.name, result)
+        if current:
+            self.result_ready.emit(measurement.name, operation)
+
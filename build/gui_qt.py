@@ -15,6 +15,7 @@ from PyQt5.QtWidgets import (
 )
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 
+import recorder
 from widgets_qt import DatasetRow, DaqStatusIndicator, PlotTypeButton, QtConsoleRedirector
 
 
@@ -27,15 +28,22 @@ class _ClickableLabel(QLabel):
 
 
 class MainWindow(QMainWindow):
-    def __init__(self, sampler, plotter, report, data_holder):
+    ARCHIVE_FILTER = "LaserTool archive (*.lab)"
+    CSV_FILTER = "CSV files (*.csv)"
+
+    def __init__(self, sampler, plotter, report, data_holder, derived):
         super().__init__()
         self.sampler = sampler
         self.plotter = plotter
         self.report = report
         self.data_holder = data_holder
+        self.derived = derived  # DerivedDataService - all regrid/detrend/filter work goes through it
+        self.derived.result_ready.connect(self._derived_ready)
+        self.derived.failed.connect(self._derived_failed)
 
         self.connection_established = False
         self.reference = None
+        self._pending_reference = None  # set as reference once its derive job is done
         self.dataset_rows = []
 
         self.setWindowTitle("LaserTool")
@@ -68,6 +76,8 @@ class MainWindow(QMainWindow):
         self._connection_timer.start(1000)
         self._check_connection_status()
 
+        QTimer.singleShot(0, self._recover_recordings)  # after the window is up
+
     # --- layout construction ----------------------------------------------------
 
     def _build_plot_frame(self, live):
@@ -90,6 +100,7 @@ class MainWindow(QMainWindow):
         layout.setContentsMargins(10, 10, 10, 10)
 
         layout.addWidget(self._build_sample_group())
+        layout.addWidget(self._build_live_analysis_group())
         layout.addWidget(self._build_plot_limits_group())
         layout.addWidget(self._build_save_group())
         layout.addWidget(self._build_misc_group())
@@ -117,6 +128,12 @@ class MainWindow(QMainWindow):
         self.clear_button.clicked.connect(self._clear_sampler)
         layout.addWidget(self.clear_button)
 
+        self.record_check = QCheckBox("Rec")
+        self.record_check.setChecked(True)
+        self.record_check.setToolTip("Stream samples to disk while sampling instead of keeping them in memory.\n"
+                                     "An interrupted recording is offered for recovery on the next start.")
+        layout.addWidget(self.record_check)
+
         # self.dummy_button = QPushButton("Dummy")
         # self.dummy_button.setToolTip("Generate simulated live data, no Arduino required.")
         # self.dummy_button.clicked.connect(self._start_dummy_sampling)
@@ -136,6 +153,45 @@ class MainWindow(QMainWindow):
 
         return group
 
+    def _build_live_analysis_group(self):
+        group = QGroupBox("Live analysis")
+        layout = QHBoxLayout(group)
+        layout.setSpacing(4)
+        layout.setContentsMargins(6, 4, 6, 4)
+
+        self.live_result_label = QLabel()
+        self.live_result_label.setMinimumWidth(210)
+        layout.addWidget(self.live_result_label)
+
+        self.budget_status_label = QLabel()
+        self.budget_status_label.setFixedWidth(40)
+        layout.addWidget(self.budget_status_label)
+
+        layout.addStretch(1)
+
+        self.max_slope_entry = QLineEdit()
+        self.max_slope_entry.setPlaceholderText("slope")
+        self.max_slope_entry.setToolTip("Error budget: maximum |slope| (µm/m), empty = not checked")
+        self.max_slope_entry.setFixedWidth(45)
+        self.max_slope_entry.editingFinished.connect(self._update_error_budget)
+        layout.addWidget(self.max_slope_entry)
+
+        self.max_ptp_entry = QLineEdit()
+        self.max_ptp_entry.setPlaceholderText("ptp")
+        self.max_ptp_entry.setToolTip("Error budget: maximum detrended peak-to-peak (µm), empty = not checked")
+        self.max_ptp_entry.setFixedWidth(45)
+        self.max_ptp_entry.editingFinished.connect(self._update_error_budget)
+        layout.addWidget(self.max_ptp_entry)
+
+        self.live_smooth_entry = QLineEdit("0")
+        self.live_smooth_entry.setToolTip("Savitzky-Golay smoothing window for the live plot (mm), 0 = off")
+        self.live_smooth_entry.setFixedWidth(30)
+        self.live_smooth_entry.editingFinished.connect(self._update_live_smoothing)
+        layout.addWidget(self.live_smooth_entry)
+
+        self.update_live_analysis(self.plotter.analysis)
+        return group
+
     def _build_plot_limits_group(self):
         group = QGroupBox("Plot limits")
         layout = QHBoxLayout(group)
@@ -305,6 +361,12 @@ class MainWindow(QMainWindow):
     # --- sampling ----------------------------------------------------------------
 
     def _start_sampling(self):
+        if self.record_check.isChecked() and self.data_holder.recording is None:
+            try:
+                self.data_holder.start_recording()
+            except OSError as e:
+                QMessageBox.warning(self, "Warning", f"Could not start recording to disk, keeping data in memory:\n{e}")
+            self.record_check.setEnabled(self.data_holder.recording is None)
         if self.sampler.start_sampler():
             self.plotter.start()
             self.start_button.setEnabled(False)
@@ -329,9 +391,32 @@ class MainWindow(QMainWindow):
         self._update_daq_status()
 
     def _clear_sampler(self):
+        if not self.sampler.sampling:  # otherwise clearing just restarts the recording in a fresh file
+            self.data_holder.stop_recording()
+            self.record_check.setEnabled(True)
         self.plotter.clear_plot1()  # also clears data_holder.live_data
         self.update_sample_count(0, 0)
 
+    def _recover_recordings(self):
+        paths = recorder.find_recordings()
+        if not paths:
+            return
+        reply = QMessageBox.question(self, "Recover", f"Found {len(paths)} recording(s) from an interrupted "
+                                                      "session. Recover them as datasets?\n"
+                                                      "(No discards them.)",
+                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+        for path in paths:
+            try:
+                if reply == QMessageBox.Yes:
+                    measurement = self.data_holder.recover_recording(path)
+                    if measurement is not None:
+                        self._add_dataset_row(measurement.name)
+                        print(f"Recovered {measurement.name} ({len(measurement.original[0])} samples)")
+                else:
+                    os.remove(path)
+            except (OSError, ValueError) as e:
+                QMessageBox.critical(self, "Error", f"Failed to recover {os.path.basename(path)}:\n{e}")
+
     def _check_connection_status(self):
         if self.sampler.is_connected():
             if not self.connection_established:
@@ -365,9 +450,60 @@ class MainWindow(QMainWindow):
 
     def update_sample_count(self, count, total_count):  # called every animation frame by PlotterQt
         if total_count > count:
-            self.sample_count_label.setText(f"{total_count} ({count})")
+            text = f"{total_count} ({count})"
         else:
-            self.sample_count_label.setText(f"{count}")
+            text = f"{count}"
+        recording = self.data_holder.recording
+        if recording is not None and recording.error is not None:
+            text += " - recording failed"
+        elif recording is not None and recording.dropped:
+            text += f" - {recording.dropped} dropped"
+        self.sample_count_label.setText(text)
+        self.sample_count_label.setToolTip(self.data_holder.recording_problem() or "")
+
+    def update_reference_status(self, out_of_range):  # called every animation frame by PlotterQt while a reference is set
+        text = f"Reference: {self.reference}"
+        if out_of_range:
+            text += f" ({out_of_range} samples outside its range)"
+        if self.reference_label.text() != text:
+            self.reference_label.setText(text)
+
+    @staticmethod
+    def _parse_limit(text):
+        try:
+            value = float(text)
+        except ValueError:
+            return None
+        return value if value > 0 else None
+
+    def _update_error_budget(self):
+        budget = self.plotter.analysis.budget
+        budget.max_slope = self._parse_limit(self.max_slope_entry.text())
+        budget.max_ptp = self._parse_limit(self.max_ptp_entry.text())
+        self.update_live_analysis(self.plotter.analysis)
+
+    def _update_live_smoothing(self):
+        try:
+            window = max(int(self.live_smooth_entry.text()), 0)
+        except ValueError:
+            window = 0
+        self.live_smooth_entry.setText(str(window))
+        self.plotter.set_live_smoothing(window)
+
+    def update_live_analysis(self, analysis):  # called every animation frame by PlotterQt
+        slope, ptp = analysis.slope, analysis.ptp
+        slope_text = f"{slope:.2f}" if slope is not None else "-"
+        ptp_text = f"{ptp:.2f}" if ptp is not None else "-"
+        self.live_result_label.setText(f"slope: {slope_text} µm/m  ptp: {ptp_text} µm")
+
+        verdict = analysis.within_budget()
+        if verdict is None:
+            self.budget_status_label.setText("")
+            self.budget_status_label.setStyleSheet("")
+        else:
+            color = "#2ecc71" if verdict else "#e74c3c"
+            self.budget_status_label.setText("PASS" if verdict else "FAIL")
+            self.budget_status_label.setStyleSheet(f"color: white; background-color: {color}; border-radius: 3px;")
 
     # --- dataset management --------------------------------------------------------
 
@@ -375,12 +511,19 @@ class MainWindow(QMainWindow):
         name, ok = QInputDialog.getText(self, "Input", "Enter measurement name:")
         if not ok:
             return
+        problem = self.data_holder.recording_problem()
+        if problem:
+            reply = QMessageBox.question(self, "Incomplete recording", f"{problem}\nAdd the incomplete data anyway?",
+                                         QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if reply != QMessageBox.Yes:
+                return
         try:
-            measurement = self.data_holder.add_measurement(name)
+            measurement = self.data_holder.add_measurement(name, derive=False, allow_incomplete=bool(problem))
         except ValueError as e:
             QMessageBox.critical(self, "Error", str(e))
             return
         self._add_dataset_row(measurement.name)
+        self.derived.request_derive(measurement.name)
 
     def _add_dataset_row(self, name):
         row = DatasetRow(name, tooltip_provider=self._get_results)
@@ -409,8 +552,14 @@ class MainWindow(QMainWindow):
         if self.reference == old_name:
             self.reference = resolved
             self.reference_label.setText(f"Reference: {self.reference}")
+        if self._pending_reference == old_name:
+            self._pending_reference = resolved
+            self.reference_label.setText(f"Reference: {resolved} (preparing...)")
 
     def _remove_dataset(self, name):
+        measurement = self.data_holder.measurements.get(name)
+        if measurement is not None:
+            self.derived.forget(measurement)
         self.data_holder.remove_measurement(name)
         row = self._row_by_name(name)
         if row is not None:
@@ -419,13 +568,23 @@ class MainWindow(QMainWindow):
             row.deleteLater()
         if self.reference == name:
             self._clear_reference()
+        if self._pending_reference == name:
+            self._pending_reference = None  # the current reference, if any, stays
+            self.reference_label.setText(f"Reference: {self.reference}")
 
     def _set_reference(self, name):
-        try:
-            self.data_holder.extend_data(name)
-        except ValueError as e:
-            QMessageBox.critical(self, "Error", f"Failed to set reference:\n{e}")
+        # The live stream is compensated against the extended data - if that's
+        # still being computed, the reference takes over once it arrives.
+        measurement = self.data_holder.measurements.get(name)
+        if measurement is None:
+            return
+        if measurement.extended is None:
+            self._pending_reference = name
+            if not self.derived.is_pending(measurement):
+                self.derived.request_derive(name)
+            self.reference_label.setText(f"Reference: {name} (preparing...)")
             return
+        self._pending_reference = None
         self.reference = name
         self.reference_label.setText(f"Reference: {self.reference}")
 
@@ -433,14 +592,24 @@ class MainWindow(QMainWindow):
         return self.reference
 
     def _clear_reference(self):
+        self._pending_reference = None
         self.reference = None
         self.reference_label.setText(f"Reference: {self.reference}")
 
     def _update_filter(self, name, cutoff):
-        try:
-            self.data_holder.update_filter(name, cutoff)
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to update filter:\n{e}")
+        if name in self.data_holder.measurements:
+            self.derived.request_filter(name, cutoff)  # the plot updates when the result arrives
+
+    def _derived_ready(self, name, operation):
+        if operation == self.derived.DERIVE and name == self._pending_reference:
+            self._set_reference(name)
+
+    def _derived_failed(self, name, operation, message):
+        if operation == self.derived.DERIVE:
+            self._remove_dataset(name)
+            QMessageBox.warning(self, "Warning", f"Dataset '{name}' could not be processed and was removed:\n{message}")
+        else:
+            QMessageBox.critical(self, "Error", f"Failed to update filter:\n{message}")
 
     def _get_results(self, name):
         measurement = self.data_holder.measurements.get(name)
@@ -479,11 +648,13 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Warning", "No data selected!")
             return
 
-        save_path, _ = QFileDialog.getSaveFileName(self, "Save data", "", "CSV files (*.csv)")
+        save_path, selected_filter = QFileDialog.getSaveFileName(
+            self, "Save data", "", f"{self.ARCHIVE_FILTER};;{self.CSV_FILTER}")
         if not save_path:
             return
-        if not save_path.lower().endswith(".csv"):
-            save_path += ".csv"
+        extension = ".csv" if selected_filter == self.CSV_FILTER else ".lab"
+        if not save_path.lower().endswith((".csv", ".lab")):
+            save_path += extension
 
         try:
             result = self.data_holder.save(save_path, names)
@@ -502,19 +673,21 @@ class MainWindow(QMainWindow):
             QMessageBox.information(self, "Success", "Data saved successfully!")
 
     def _load_data(self):
-        load_path, _ = QFileDialog.getOpenFileName(self, "Load data", "", "CSV files (*.csv)")
+        load_path, _ = QFileDialog.getOpenFileName(
+            self, "Load data", "", f"Measurement files (*.lab *.csv);;{self.ARCHIVE_FILTER};;{self.CSV_FILTER}")
         if not load_path:
             return
 
         try:
             parsed = self.data_holder.load(load_path)
-        except OSError as e:
+        except (OSError, ValueError) as e:
             QMessageBox.critical(self, "Error", f"Failed to read file:\n{e}")
             return
 
-        result = self.data_holder.import_measurements(parsed.measurements, self._resolve_name_conflict)
+        result = self.data_holder.import_measurements(parsed.measurements, self._resolve_name_conflict, derive=False)
         for name in result.loaded:
             self._add_dataset_row(name)
+            self.derived.request_derive(name)
 
         message_parts = []
         if result.loaded:
@@ -549,7 +722,8 @@ class MainWindow(QMainWindow):
 
         temp_plot_path = 'temp_plot.png'
         try:
-            self.report.copy_and_resize_plot(self.plotter.fig2, self.plotter.ax2, temp_plot_path)
+            with self.plotter.full_extent():  # not just what the current zoom shows
+                self.report.copy_and_resize_plot(self.plotter.fig2, self.plotter.ax2, temp_plot_path)
             self.report.create_report(save_path, temp_plot_path)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to create report:\n{e}")
@@ -567,7 +741,8 @@ class MainWindow(QMainWindow):
             save_path += ".png"
 
         try:
-            self.report.copy_and_resize_plot(self.plotter.fig2, self.plotter.ax2, 'temp_plot.png', save=save_path)
+            with self.plotter.full_extent():  # not just what the current zoom shows
+                self.report.copy_and_resize_plot(self.plotter.fig2, self.plotter.ax2, 'temp_plot.png', save=save_path)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to save PNG:\n{e}")
             return
@@ -595,6 +770,10 @@ class MainWindow(QMainWindow):
         reply = QMessageBox.question(self, "Quit", "Do you want to quit?",
                                       QMessageBox.Ok | QMessageBox.Cancel, QMessageBox.Ok)
         if reply == QMessageBox.Ok:
+            if self.sampler.sampling:
+                self.sampler.stop_sampling()
+            self.data_holder.stop_recording()  # a clean exit leaves nothing to recover
+            self.derived.shutdown()
             sys.stdout = sys.__stdout__
             sys.stderr = sys.__stderr__
             event.accept()
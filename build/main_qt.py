@@ -2,12 +2,14 @@
 #
 # Entry point for the PyQt5 version of the measurement app.
 
+import multiprocessing
 import sys
 import traceback
 
 from PyQt5.QtWidgets import QApplication, QMessageBox
 
 from data_model import DataStore
+from derived_qt import DerivedDataService
 from Sampler import Sampler
 from Report import Report
 from plotter_qt import PlotterQt
@@ -34,8 +36,10 @@ def main():
     sampler = Sampler(None, data_holder)
     report = Report()
     plotter = PlotterQt(data_holder)
+    derived = DerivedDataService(data_holder)
+    derived.result_ready.connect(plotter.on_derived_ready)
 
-    window = MainWindow(sampler, plotter, report, data_holder)
+    window = MainWindow(sampler, plotter, report, data_holder, derived)
     plotter.set_gui(window)
 
     window.show()
@@ -43,4 +47,5 @@ def main():
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # DerivedDataService's process pool in a frozen (PyInstaller) build
     main()
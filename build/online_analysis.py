@@ -0,0 +1,308 @@
+# online_analysis.py
+#
+# Incremental versions of the post-hoc analysis in data_model.py, fed with the
+# live sample batches so slope, ptp and an error-budget verdict are known while
+# the carriage is still moving. Every update is O(batch size) - O(1) per
+# sample - and nothing is ever recomputed over the whole run:
+#
+#   - RunningTrend keeps the least-squares sums for y = a*x + b.
+#   - RunningHull keeps the upper and lower convex hull of the samples. The
+#     largest and smallest residual against any line lie on a hull vertex, so
+#     the detrended ptp against the current trend is a lookup on the hulls -
+#     the same value np.ptp gives over all samples detrended with that trend.
+#   - StreamingSavgol collapses samples per position and interpolates the same
+#     grid extend_data builds, then runs the Savitzky-Golay kernel
+#     DataStore.update_filter would use over the grid points as they become
+#     final (interior points only, delayed by about a window - the offline
+#     filter's edge fits need the future). Each travel direction is a pass of
+#     its own.
+
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from scipy.signal import savgol_coeffs
+
+from data_model import FILTER_POLYORDER
+from regrid import DEFAULT_STEP, DEFAULT_TOLERANCE
+
+
+@dataclass
+class ErrorBudget:
+    max_slope: Optional[float] = None  # |slope| limit in µm/m, None = not checked
+    max_ptp: Optional[float] = None  # detrended peak-to-peak limit in µm, None = not checked
+
+
+class RunningTrend:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.n = 0
+        self._origin = None  # sums are taken around the first sample to avoid cancellation
+        self._sx = self._sy = self._sxx = self._sxy = 0.0
+
+    def update(self, x, y):
+        if len(x) == 0:
+            return
+        if self._origin is None:
+            self._origin = (float(x[0]), float(y[0]))
+        dx = x - self._origin[0]
+        dy = y - self._origin[1]
+        self.n += len(dx)
+        self._sx += float(dx.sum())
+        self._sy += float(dy.sum())
+        self._sxx += float(dx @ dx)
+        self._sxy += float(dx @ dy)
+
+    def coefficients(self):
+        """(a, b) of the least-squares line through everything so far, or
+        (None, None) while there are fewer than 2 distinct x positions."""
+        if self.n < 2:
+            return None, None
+        denominator = self.n * self._sxx - self._sx ** 2
+        if denominator <= 1e-12 * self.n * self._sxx:
+            return None, None
+        a = (self.n * self._sxy - self._sx * self._sy) / denominator
+        b_local = (self._sy - a * self._sx) / self.n
+        x0, y0 = self._origin
+        return a, y0 + b_local - a * x0
+
+
+class StreamingSavgol:
+    """Savitzky-Golay over the regrid() grid of the samples seen so far, one
+    travel direction at a time. Samples are collapsed per `tolerance` bin like
+    collapse_duplicates() does; a bin only counts as final once the carriage
+    is half a window (at least one grid step) past it, so jitter around a
+    position keeps adding to the same bin instead of emitting it again. Grid
+    points start at the first sample of a pass, as regrid()'s start at min(x)
+    for forward travel. Coming back into already final positions starts a
+    new pass."""
+
+    def __init__(self, window_length, polyorder=FILTER_POLYORDER, step=DEFAULT_STEP, tolerance=DEFAULT_TOLERANCE):
+        # Same window rules as DataStore.update_filter (odd, > polyorder).
+        window_length = max(int(window_length), polyorder + 1)
+        if window_length % 2 == 0:
+            window_length += 1
+        self.window_length = window_length
+        self.step = step
+        self.tolerance = tolerance
+        self.settle = max(window_length // 2, 1) * step  # how far past a position it becomes final
+        self._coefficients = savgol_coeffs(window_length, polyorder)
+        self.reset()
+
+    def reset(self):
+        self.passes = 0
+        self._start_pass()
+
+    def _start_pass(self):
+        self._origin = None  # x of the pass' first sample = its first grid point
+        self._direction = 0  # +1/-1 once the carriage has moved a grid step away from the origin
+        self._front = None  # furthest position reached, as u = direction * x
+        self._bins = {}  # tolerance bin -> [sum x, sum y, count], for bins not final yet
+        self._next = 0  # index of the next grid point to interpolate
+        self._last_final = None  # (u, y) of the last final bin, for interpolating across batches
+        self._history_x = np.empty(0)  # last window_length - 1 grid points
+        self._history_y = np.empty(0)
+
+    def update(self, x, y):
+        """Returns the (x, y) of the smoothed grid points that became final
+        with this batch - usually none or a few."""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        done_x, done_y = [], []
+        while len(x):
+            used, reversed_ = self._consume(x, y)
+            grid_x, grid_y = self._final_grid(flush=reversed_)
+            smoothed = self._smooth(grid_x, grid_y)
+            done_x.append(smoothed[0])
+            done_y.append(smoothed[1])
+            if reversed_:
+                self._start_pass()
+                self.passes += 1
+            x, y = x[used:], y[used:]
+        if not done_x:
+            return np.empty(0), np.empty(0)
+        return np.concatenate(done_x), np.concatenate(done_y)
+
+    def _consume(self, x, y):
+        # Bins the samples up to the first one that comes back into final
+        # positions. Returns (samples used, whether the pass ended there).
+        if self._origin is None:
+            self._origin = float(x[0])
+        used, reversed_ = len(x), False
+        if self._direction == 0:
+            moved = np.flatnonzero(np.abs(x - self._origin) >= self.step)
+            if len(moved):
+                self._direction = 1 if x[moved[0]] > self._origin else -1
+                self._front = self._direction * self._origin
+        if self._direction != 0:
+            u = self._direction * x
+            front = np.maximum.accumulate(np.concatenate(([self._front], u)))[1:]
+            back = np.flatnonzero(u < front - self.settle)
+            if len(back):
+                used, reversed_ = int(back[0]), True
+            if used:
+                self._front = float(front[used - 1])
+        keys, inverse = np.unique(np.round(x[:used] / self.tolerance).astype(np.int64), return_inverse=True)
+        sums_x = np.bincount(inverse, weights=x[:used], minlength=len(keys))
+        sums_y = np.bincount(inverse, weights=y[:used], minlength=len(keys))
+        counts = np.bincount(inverse, minlength=len(keys))
+        for key, sx, sy, n in zip(keys.tolist(), sums_x.tolist(), sums_y.tolist(), counts.tolist()):
+            entry = self._bins.get(key)
+            if entry is None:
+                self._bins[key] = [sx, sy, n]
+            else:
+                entry[0] += sx
+                entry[1] += sy
+                entry[2] += n
+        return used, reversed_
+
+    def _final_grid(self, flush=False):
+        # Moves the bins behind the front (all of them at the end of a pass)
+        # out of _bins and interpolates every grid point they now cover.
+        if self._direction == 0:
+            return np.empty(0), np.empty(0)
+        d = self._direction
+        limit = np.inf if flush else self._front - self.settle
+        final = [(d * sx / n, sy / n) for key, (sx, sy, n) in self._bins.items() if d * sx / n <= limit]
+        if not final:
+            return np.empty(0), np.empty(0)
+        for key in [key for key, (sx, _, n) in self._bins.items() if d * sx / n <= limit]:
+            del self._bins[key]
+        final.sort()
+        if self._last_final is not None:
+            final.insert(0, self._last_final)
+        self._last_final = final[-1]
+        u_final = np.array([u for u, _ in final])
+        y_final = np.array([value for _, value in final])
+
+        count = int(np.floor((u_final[-1] - d * self._origin) / self.step + 1e-9)) + 1 - self._next
+        if count <= 0:
+            return np.empty(0), np.empty(0)
+        k = np.arange(self._next, self._next + count)
+        self._next += count
+        u_grid = d * self._origin + k * self.step
+        return d * u_grid, np.interp(u_grid, u_final, y_final)
+
+    def _smooth(self, grid_x, grid_y):
+        if not len(grid_x):
+            return np.empty(0), np.empty(0)
+        grid_x = np.concatenate((self._history_x, grid_x))
+        grid_y = np.concatenate((self._history_y, grid_y))
+        keep = self.window_length - 1
+        self._history_x, self._history_y = grid_x[-keep:], grid_y[-keep:]
+        if len(grid_y) < self.window_length:
+            return np.empty(0), np.empty(0)
+        half = keep // 2
+        smoothed = np.convolve(grid_y, self._coefficients, mode='valid')
+        return grid_x[half:len(grid_x) - half], smoothed
+
+
+class RunningHull:
+    """Upper and lower convex hull of the (x, y) samples seen so far. Each
+    batch is merged with the current vertices (a straightness profile has
+    few of them), so an update is O(batch log batch) however long the run
+    is; residual_range() is a binary search over the edge slopes."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._upper = None  # (x, y, edge slopes) of the upper hull, left to right
+        self._lower = None  # same for the lower hull, of -y
+
+    def update(self, x, y):
+        if len(x) == 0:
+            return
+        self._upper = self._merge(self._upper, x, y)
+        self._lower = self._merge(self._lower, x, -y)
+
+    def residual_range(self, a):
+        """(max, min) of y - a*x over all samples, or None before the first."""
+        if self._upper is None:
+            return None
+        return self._extreme(self._upper, a), -self._extreme(self._lower, -a)
+
+    @staticmethod
+    def _extreme(hull, a):
+        # Edge slopes of an upper hull decrease left to right; the maximum of
+        # y - a*x is at the vertex where they cross a.
+        x, y, slopes = hull
+        i = int(np.searchsorted(-slopes, -a))
+        return float(y[i] - a * x[i])
+
+    @staticmethod
+    def _merge(hull, x, y):
+        if hull is not None:
+            x, y = np.concatenate((hull[0], x)), np.concatenate((hull[1], y))
+        order = np.lexsort((y, x))
+        x, y = x[order], y[order]
+        top = np.append(x[1:] != x[:-1], True)  # only the highest sample per x can be on the upper hull
+        x, y = x[top], y[top]
+        # Andrew's monotone chain, upper half
+        vertices = []
+        for point in zip(x.tolist(), y.tolist()):
+            while len(vertices) >= 2:
+                (ox, oy), (ax, ay) = vertices[-2], vertices[-1]
+                if (ax - ox) * (point[1] - oy) - (ay - oy) * (point[0] - ox) < 0:
+                    break  # right turn - the middle vertex stays
+                vertices.pop()
+            vertices.append(point)
+        x, y = np.array(vertices).T
+        return x, y, np.diff(y) / np.diff(x)
+
+
+class OnlineAnalysis:
+    def __init__(self, budget=None, smooth_window=0, min_samples=10):
+        self.budget = budget or ErrorBudget()
+        self.min_samples = min_samples  # below this slope/ptp aren't reported
+        self.trend = RunningTrend()
+        self.hull = RunningHull()
+        self.smoother = None
+        self.set_smooth_window(smooth_window)
+        self.reset()
+
+    def reset(self):
+        self.trend.reset()
+        self.hull.reset()
+        if self.smoother is not None:
+            self.smoother.reset()
+
+    def set_smooth_window(self, window_length):
+        self.smoother = StreamingSavgol(window_length) if window_length > 0 else None
+
+    def update(self, x, y):
+        """Feeds one batch. Returns the newly smoothed grid points (empty
+        arrays when smoothing is off)."""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        self.trend.update(x, y)
+        self.hull.update(x, y)
+        if self.smoother is None:
+            return np.empty(0), np.empty(0)
+        return self.smoother.update(x, y)
+
+    @property
+    def slope(self):
+        if self.trend.n < self.min_samples:
+            return None
+        return self.trend.coefficients()[0]
+
+    @property
+    def ptp(self):
+        a, _ = self.trend.coefficients()
+        if a is None or self.trend.n < self.min_samples:
+            return None
+        highest, lowest = self.hull.residual_range(a)
+        return highest - lowest
+
+    def within_budget(self):
+        """True/False against the budget, None while there's nothing to judge
+        (no limits set or not enough data yet)."""
+        checks = []
+        if self.budget.max_slope is not None and self.slope is not None:
+            checks.append(abs(self.slope) <= self.budget.max_slope)
+        if self.budget.max_ptp is not None and self.ptp is not None:
+            checks.append(self.ptp <= self.budget.max_ptp)
+        return all(checks) if checks else None
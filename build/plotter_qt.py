@@ -5,12 +5,19 @@
 # Qt widgets (DatasetRow / checkboxes) instead of Tkinter Vars, and with a
 # line/scatter toggle for the saved-data plot.
 
+from contextlib import contextmanager
 from queue import Empty
 
 import numpy as np
 from matplotlib.animation import FuncAnimation
 import matplotlib.pyplot as plt
 
+import archive
+from column_buffer import ColumnBuffer
+from decimation import MinMaxPyramid, minmax_decimate
+from online_analysis import OnlineAnalysis
+from reference import GridReference
+
 
 class PlotterQt:
     def __init__(self, data_holder):
@@ -21,9 +28,18 @@ class PlotterQt:
         self.line, = self.ax1.plot([], [])
         self.gui = None
         self.ani = None
-        self.x_data, self.y_data = [], []
         self.sample_cutoff = 100000
+        self.window = ColumnBuffer(2, capacity=self.sample_cutoff, ring=True)  # what the live plot shows
+        self.analysis = OnlineAnalysis()  # live slope/ptp/budget and streaming smoother, fed in updater()
+        self.smooth_window = ColumnBuffer(2, capacity=self.sample_cutoff, ring=True)
+        self.smooth_line, = self.ax1.plot([], [], linestyle='--')
         self.plot_type = "line"  # single source of truth, applies to both plots
+        self._lod_lines = []  # (Line2D, MinMaxPyramid, y offset) for every series in the saved-data plot
+        self._pyramids = {}  # (name, kind) -> (x, y, MinMaxPyramid), reused while the arrays are unchanged
+        self._plotted_rows = []  # rows of the last plot_data(), re-plotted when their derived data arrives
+        self._reference = None  # (reference Measurement, its extended data, GridReference) for the live stream
+        self.fig2.canvas.mpl_connect('resize_event', lambda event: self._refresh_lod())
+        data_holder.release_hooks.append(self._release_mapping)
         self._apply_line_style(self.line)
         self.set_ax1()
         self.set_ax2()
@@ -42,11 +58,32 @@ class PlotterQt:
         self.ax2.set_ylabel('Displacement (µm)')
         self.ax2.set_title('Saved Data')
         self.ax2.grid(True)
+        # ax.clear() drops axes callbacks, so this is (re)connected with the labels.
+        self.ax2.callbacks.connect('xlim_changed', lambda ax: self._refresh_lod())
 
     def set_plot_type(self, plot_type):
         self.plot_type = plot_type
         self._apply_line_style(self.line)
-        self.ax1.figure.canvas.draw()
+        self._redraw_live()
+
+    def _redraw_live(self):
+        # With blitting the live line is an animated artist, which a full draw()
+        # leaves out - blit it back on top right away rather than waiting for the
+        # next animation frame (which never comes while sampling is stopped). The
+        # animation's cached background is only recaptured when the view limits
+        # change, so this can't leak the line into it.
+        canvas = self.ax1.figure.canvas
+        canvas.draw()
+        if self.line.get_animated():
+            self.ax1.draw_artist(self.line)
+            self.ax1.draw_artist(self.smooth_line)
+            canvas.blit(self.ax1.bbox)
+
+    def set_live_smoothing(self, window_length):  # window in mm/grid points, 0 = off
+        self.analysis.set_smooth_window(window_length)
+        self.smooth_window.clear()
+        self.smooth_line.set_data([], [])
+        self._redraw_live()
 
     def _apply_line_style(self, line):
         # A styled Line2D (marker-only for "scatter") keeps the live plot on the
@@ -59,7 +96,7 @@ class PlotterQt:
             line.set_linestyle('-')
             line.set_marker('None')
 
-    def update_limit(self):  # Handles X-limit changes.
+    def update_limit(self, x, y):  # Handles X-limit changes. Only redraws the full canvas if the limits moved.
         if self.gui.manual_limit_check.isChecked():
             try:
                 x_min = float(self.gui.x_min_entry.text())
@@ -69,18 +106,42 @@ class PlotterQt:
                     self.ax1.figure.canvas.draw()
             except ValueError:
                 pass  # Freezes limits if x_min/x_max aren't valid floats yet
-        else:
-            self.ax1.set_xlim(auto=True)
-            self.ax1.set_ylim(auto=True)
-            self.ax1.relim()
-            self.ax1.autoscale_view()
-            self.ax1.figure.canvas.draw()
+        elif len(x):
+            x_lim = self._fit_limit(self.ax1.get_xlim(), x.min(), x.max())
+            y_lim = self._fit_limit(self.ax1.get_ylim(), y.min(), y.max())
+            if x_lim is not None or y_lim is not None:
+                if x_lim is not None:
+                    self.ax1.set_xlim(x_lim)
+                if y_lim is not None:
+                    self.ax1.set_ylim(y_lim)
+                self.ax1.figure.canvas.draw()
+
+    @staticmethod
+    def _fit_limit(limit, data_min, data_max, margin=0.1):
+        # Returns new limits only if the data left the current ones, or shrank to
+        # under half of them - with the margin as headroom, a moving carriage
+        # triggers a full redraw every so often instead of on every frame.
+        lo, hi = limit
+        if lo <= data_min and data_max <= hi and (data_max - data_min) >= 0.5 * (hi - lo):
+            return None
+        span = data_max - data_min or abs(data_max) or 1.0
+        return data_min - margin * span, data_max + margin * span
+
+    def _live_pixels(self, x):
+        # Points per axes pixel width; when manual limits zoom into part of the
+        # window, scale up so the visible part still gets one bucket per pixel.
+        pixels = self.ax1.bbox.width
+        x_min, x_max = self.ax1.get_xlim()
+        if len(x) and x_max > x_min:
+            pixels *= max((x.max() - x.min()) / (x_max - x_min), 1.0)
+        return pixels
 
     def plot_data(self, rows):  # rows: list[DatasetRow] with plot_check checked
         if self.ax2 is None:
             return
 
         self.clear_plot2()
+        self._plotted_rows = list(rows)
 
         for row in rows:
             measurement = self.data_holder.measurements.get(row.name)
@@ -91,23 +152,77 @@ class PlotterQt:
             detrended = row.detrend_check.isChecked()
 
             if detrended and measurement.detrended is not None:
+                kind = "detrended"
                 x, y = measurement.detrended
-                label = f"{row.name} (detrended)"
             else:
+                kind = "original"
                 x, y = measurement.original
-                label = f"{row.name} (original)"
-            self._draw_series(x, np.array(y) + delta_y, label)
+            pyramid = self._pyramid(row.name, kind, x, y)
+            self._draw_series(pyramid, delta_y, f"{row.name} ({kind})")
 
             if row.trend_check.isChecked() and measurement.coefficients is not None:
-                self._add_trend_line(x, delta_y, row.name, measurement, detrended)
+                self._add_trend_line(pyramid.x, delta_y, row.name, measurement, detrended)
 
             if measurement.filtered is not None:
                 xf, yf = measurement.filtered
-                self.ax2.plot(xf, np.array(yf) + delta_y, label=f"{row.name} (filtered)", linestyle='--')
+                self._draw_series(self._pyramid(row.name, "filtered", xf, yf), delta_y,
+                                  f"{row.name} (filtered)", linestyle='--')
 
+        plotted = {row.name for row in rows}
+        self._pyramids = {key: value for key, value in self._pyramids.items() if key[0] in plotted}
         self.add_legend()
+        self.ax2.autoscale_view()
         self.ax2.figure.canvas.draw()
 
+    def on_derived_ready(self, name, operation):  # DerivedDataService.result_ready
+        if self.gui is None:
+            return
+        rows = [row for row in self._plotted_rows if row in self.gui.dataset_rows]
+        if any(row.name == name for row in rows):
+            self.plot_data(rows)
+
+    def _release_mapping(self, path):  # DataStore.release_hooks - measurements are copied by now
+        if self._reference is not None and archive.uses_file(self._reference[1], path):
+            self._rebuild_reference(self._reference[0])  # from the in-memory copy
+        if any(archive.uses_file((x, y), path) for x, y, _ in self._pyramids.values()):
+            self._pyramids.clear()
+            rows = [row for row in self._plotted_rows if row in self.gui.dataset_rows] if self.gui else []
+            if rows:
+                self.plot_data(rows)  # rebuilds every line from the in-memory copies
+            else:
+                self.clear_plot2()
+
+    def _pyramid(self, name, kind, x, y):
+        cached = self._pyramids.get((name, kind))
+        if cached is not None and cached[0] is x and cached[1] is y:
+            return cached[2]
+        pyramid = MinMaxPyramid(x, y)
+        self._pyramids[(name, kind)] = (x, y, pyramid)
+        return pyramid
+
+    def _refresh_lod(self):
+        # Swaps every saved-data series to the decimation level that matches the
+        # current x range and axes width. Runs on zoom (xlim_changed) and resize;
+        # whoever changed the view draws afterwards.
+        pixels = self.ax2.bbox.width
+        x_min, x_max = self.ax2.get_xlim()
+        for line, pyramid, delta_y in self._lod_lines:
+            x, y = pyramid.select(pixels, x_min, x_max)
+            line.set_data(x, y + delta_y)
+
+    @contextmanager
+    def full_extent(self, pixels=2000):
+        # For exports (Report.copy_and_resize_plot copies the lines' data):
+        # every series at its whole-range level for the duration, so a report
+        # doesn't depend on the current zoom. Restored afterwards.
+        for line, pyramid, delta_y in self._lod_lines:
+            x, y = pyramid.select(pixels)
+            line.set_data(x, y + delta_y)
+        try:
+            yield
+        finally:
+            self._refresh_lod()
+
     @staticmethod
     def _parse_offset(text):
         text = text.strip()
@@ -118,19 +233,25 @@ class PlotterQt:
         except ValueError:
             return 0.0
 
-    def _draw_series(self, x, y, label):
+    def _draw_series(self, pyramid, delta_y, label, linestyle=None):
         # Same marker-only-Line2D trick as the live plot, so "what is what" stays
-        # consistent between the two plots regardless of mode.
-        if self.plot_type == "scatter":
-            self.ax2.plot(x, y, label=label, linestyle='None', marker='o', markersize=4)
+        # consistent between the two plots regardless of mode. Only the decimated
+        # level is handed to matplotlib; the data limits still come from the full series.
+        x, y = pyramid.select(self.ax2.bbox.width)
+        if linestyle is None and self.plot_type == "scatter":
+            line, = self.ax2.plot(x, y + delta_y, label=label, linestyle='None', marker='o', markersize=4)
         else:
-            self.ax2.plot(x, y, label=label)
+            line, = self.ax2.plot(x, y + delta_y, label=label, linestyle=linestyle or '-')
+        if len(pyramid):
+            self.ax2.update_datalim([(pyramid.x.min(), pyramid.y.min() + delta_y),
+                                     (pyramid.x.max(), pyramid.y.max() + delta_y)])
+        self._lod_lines.append((line, pyramid, delta_y))
 
     def _add_trend_line(self, x, delta_y, name, measurement, detrended):
         a, b = measurement.coefficients
         if detrended:
             a = 0
-        x = np.array(x)
+        x = np.array([x.min(), x.max()])  # a straight line only needs its end points
         self.ax2.plot(x, a * x + b + delta_y, label=f"Trend {name}: {a:.2f}x + {b:.2f}", linestyle='--')
 
     def add_legend(self):
@@ -148,38 +269,66 @@ class PlotterQt:
         if self.ax1 is not None:
             self.ax1.clear()
             self.line, = self.ax1.plot([], [])
+            self.smooth_line, = self.ax1.plot([], [], linestyle='--')
             self._apply_line_style(self.line)
-            self.x_data, self.y_data = [], []
+            self.window.clear()
+            self.smooth_window.clear()
+            self.analysis.reset()
+            if self._reference is not None:
+                self._reference[2].reset_counts()
             self.data_holder.clear_live_data()
             self.set_ax1()
-            self.ax1.figure.canvas.draw()
+            self._redraw_live()
 
     def clear_plot2(self):
         if self.ax2 is not None:
             self.ax2.clear()
+            self._lod_lines = []
             self.set_ax2()
             self.ax2.figure.canvas.draw()
 
+    def _live_reference(self):
+        # Rebuilt only when the reference (or its extended data) changes; the
+        # out-of-range count carries over as long as it's the same reference.
+        # The GUI only sets a reference whose extended data exists, so nothing
+        # is computed here beyond the index itself.
+        name = self.gui.get_reference()
+        measurement = self.data_holder.measurements.get(name) if name else None
+        if measurement is None or measurement.extended is None:
+            self._reference = None
+            return None
+        if self._reference is None or self._reference[1] is not measurement.extended:
+            self._rebuild_reference(measurement)
+        return self._reference[2]
+
+    def _rebuild_reference(self, measurement):
+        reference = GridReference(*measurement.extended, tolerance=self.data_holder.grid_tolerance)
+        if self._reference is not None and self._reference[0] is measurement:
+            reference.compensated = self._reference[2].compensated
+            reference.out_of_range = self._reference[2].out_of_range
+        self._reference = (measurement, measurement.extended, reference)
+
     def updater(self, i):
+        reference = self._live_reference()
         while not self.out_queue.empty():
-            new_data = self.out_queue.get()
-            reference_name = self.gui.get_reference()
-            if reference_name:
-                new_data = self.data_holder.calc_reference(reference_name, new_data)
-            if not new_data:
-                continue
-            self.x_data.append(new_data[0])
-            self.y_data.append(new_data[1])
-            self.data_holder.live_data.append((new_data[0], new_data[1]))
-
-        if len(self.x_data) > self.sample_cutoff:
-            self.x_data = self.x_data[-self.sample_cutoff:]
-            self.y_data = self.y_data[-self.sample_cutoff:]
+            x_batch, y_batch = self.out_queue.get()  # one (x_array, y_array) batch per serial read
+            if reference is not None:
+                x_batch, y_batch = reference.subtract(x_batch, y_batch)  # whole batch, O(1) per sample
+                if not len(x_batch):
+                    continue
+            self.window.extend(x_batch, y_batch)  # ring buffer: only the newest sample_cutoff are kept
+            self.data_holder.append_live(x_batch, y_batch)  # kept in memory, or spilled to disk while recording
+            self.smooth_window.extend(*self.analysis.update(x_batch, y_batch))
 
-        self.line.set_data(self.x_data, self.y_data)
-        self.update_limit()
-        self.gui.update_sample_count(len(self.x_data), len(self.data_holder.live_data))
-        return self.line,
+        x, y = self.window.columns()  # zero-copy views into the ring buffer
+        self.update_limit(x, y)
+        self.line.set_data(*minmax_decimate(x, y, self._live_pixels(x)))
+        self.smooth_line.set_data(*self.smooth_window.columns())
+        self.gui.update_sample_count(len(self.window), self.data_holder.get_number_live_data())
+        self.gui.update_live_analysis(self.analysis)
+        if reference is not None:
+            self.gui.update_reference_status(reference.out_of_range)
+        return self.line, self.smooth_line
 
     def start(self):
         while True:  # drain stale samples from before Start was pressed
@@ -189,11 +338,11 @@ class PlotterQt:
                 break
 
         if self.ani is None:
-            # blit=False: a manual full redraw (e.g. from set_plot_type) would otherwise
-            # desync blit's cached background, making the plot flash empty until the next
-            # data point forces a re-capture. At this frame rate (10 Hz, one line) a full
-            # redraw every frame costs nothing noticeable.
-            self.ani = FuncAnimation(self.fig1, self.updater, interval=100, blit=False, cache_frame_data=False)
+            # blit=True: a frame only redraws the live line over the cached background;
+            # update_limit() does a full draw only when the limits actually move, and
+            # manual full redraws (set_plot_type, clear) go through _redraw_live() so
+            # the line doesn't vanish until the next frame.
+            self.ani = FuncAnimation(self.fig1, self.updater, interval=100, blit=True, cache_frame_data=False)
         # FuncAnimation only auto-arms its timer on the figure's first real draw event,
         # which normally comes from plt.show() - we embed the figure directly in Qt and
         # never call that, so the timer can simply never start on its own. Start it
@@ -0,0 +1,153 @@
+# recorder.py
+#
+# Append-only spill-to-disk recording of the live acquisition stream, so a
+# multi-hour run doesn't have to live in RAM and survives a crash or a pulled
+# USB cable. File layout:
+#
+#     b'LABREC01'
+#     chunk*: <u4 sample count> <u4 crc32 of payload> <count x float64> <count y float64>
+#
+# Chunks are only ever appended. A chunk cut short by a crash (or whose CRC
+# doesn't match) marks the end of the usable data - everything before it is
+# recovered by read_recording().
+#
+# The caller's thread only puts batches on a bounded queue; a background
+# thread coalesces them into chunks and does the actual writing.
+
+import glob
+import os
+import struct
+import threading
+import time
+import zlib
+from queue import Full, Queue
+
+import numpy as np
+
+MAGIC = b'LABREC01'
+_CHUNK_HEADER = struct.Struct('<II')
+RECORDING_DIR = os.path.join(os.path.expanduser('~'), '.lasertool', 'recordings')
+RECORDING_SUFFIX = '.rec'
+
+
+class Recorder:
+    def __init__(self, path, max_pending=256, fsync_interval=1.0):
+        self.path = path
+        self.count = 0  # samples written or still queued to be - never more than end up in the file
+        self.dropped = 0  # samples lost because the writer fell max_pending batches behind or failed
+        self.error = None  # first write error (e.g. disk full), writing stops after it
+        self._lock = threading.Lock()  # count/dropped are updated from both threads
+        self._fsync_interval = fsync_interval
+        self._queue = Queue(maxsize=max_pending)
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._file.flush()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def append(self, x, y):
+        # Called from the GUI thread, so it never waits: if the writer is
+        # max_pending batches behind (stalled disk) or has failed, the batch is
+        # counted as dropped instead.
+        if self.error is not None:
+            self._lost(len(x), queued=False)
+            return
+        # Copy: the caller may hand in views of a buffer it keeps writing to.
+        batch = (np.array(x, dtype=np.float64), np.array(y, dtype=np.float64))
+        with self._lock:  # counted before the writer can see (and possibly lose) the batch
+            self.count += len(batch[0])
+        try:
+            self._queue.put_nowait(batch)
+        except Full:
+            self._lost(len(batch[0]))
+
+    def flush(self):
+        """Blocks until everything appended so far is written to the file."""
+        self._queue.join()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._file.close()
+
+    def _run(self):
+        last_sync = 0.0
+        stop = False
+        while not stop:
+            batches = [self._queue.get()]
+            while not self._queue.empty() and len(batches) < 64:  # coalesce whatever piled up into one chunk
+                batches.append(self._queue.get_nowait())
+            if batches[-1] is None:
+                batches.pop()
+                stop = True
+            written = False
+            try:
+                if batches and self.error is None:
+                    self._write_chunk(batches)
+                    written = True  # in the file even if the fsync below fails
+                    now = time.monotonic()
+                    if stop or now - last_sync >= self._fsync_interval:
+                        os.fsync(self._file.fileno())
+                        last_sync = now
+                elif batches:  # queued before the error - they won't reach the file
+                    self._lost(sum(len(batch[0]) for batch in batches))
+            except Exception as e:  # anything - the thread must keep draining the queue or flush() hangs
+                self.error = e
+                if not written:
+                    self._lost(sum(len(batch[0]) for batch in batches))
+                print(f"Recording to {self.path} stopped: {e}")
+            finally:
+                for _ in range(len(batches) + stop):
+                    self._queue.task_done()
+
+    def _lost(self, samples, queued=True):
+        # Moves samples that won't be written from count (if they were in it) to dropped.
+        with self._lock:
+            if queued:
+                self.count -= samples
+            self.dropped += samples
+
+    def _write_chunk(self, batches):
+        x = np.concatenate([batch[0] for batch in batches])
+        y = np.concatenate([batch[1] for batch in batches])
+        payload = x.astype('<f8').tobytes() + y.astype('<f8').tobytes()
+        self._file.write(_CHUNK_HEADER.pack(len(x), zlib.crc32(payload)) + payload)
+        self._file.flush()
+
+
+def read_recording(path):
+    """Reads every intact chunk. Returns (x, y, complete) where complete is
+    False if the file ends in a torn/corrupt chunk (which is ignored).
+    x and y are filled in place - sized from the file, so a multi-hour run is
+    held once, not once per chunk and again concatenated."""
+    capacity = max(os.path.getsize(path) - len(MAGIC), 0) // 16  # at least the samples in the file
+    x, y = np.empty(capacity), np.empty(capacity)
+    n = 0
+    complete = True
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{os.path.basename(path)} is not a recording.")
+        while True:
+            header = f.read(_CHUNK_HEADER.size)
+            if not header:
+                break
+            if len(header) < _CHUNK_HEADER.size:
+                complete = False
+                break
+            count, crc = _CHUNK_HEADER.unpack(header)
+            payload = f.read(16 * count)
+            if len(payload) < 16 * count or zlib.crc32(payload) != crc:
+                complete = False
+                break
+            values = np.frombuffer(payload, dtype='<f8')
+            x[n:n + count] = values[:count]
+            y[n:n + count] = values[count:]
+            n += count
+    return x[:n], y[:n], complete
+
+
+def find_recordings(directory=RECORDING_DIR):
+    """Recordings left behind in `directory` - a clean shutdown deletes its
+    own, so anything found at startup is from an interrupted session."""
+    return sorted(glob.glob(os.path.join(directory, '*' + RECORDING_SUFFIX)))
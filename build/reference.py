@@ -0,0 +1,66 @@
+# reference.py
+#
+# Live reference compensation: subtracts a reference measurement from whole
+# sample batches. The reference is the regridded `extended` data, so its x is
+# a uniform grid and a sample's position in it is just (x - x_min) / step -
+# no search over the reference, O(1) per sample however long it is. Between
+# grid points the reference is interpolated linearly (what np.interp would
+# give), so every sample within the reference's x range is kept.
+#
+# Samples outside that range have no reference value and are left out of the
+# compensated stream, but counted (out_of_range) so the GUI can say so.
+
+import numpy as np
+
+from regrid import DEFAULT_TOLERANCE
+
+
+class GridReference:
+    def __init__(self, grid_x, grid_y, tolerance=DEFAULT_TOLERANCE):
+        grid_x = np.asarray(grid_x, dtype=np.float64)
+        self.grid_y = np.asarray(grid_y, dtype=np.float64)
+        n = len(self.grid_y)
+        if n == 0 or len(grid_x) != n:
+            raise ValueError("Reference has no data points.")
+        self.x_min = float(grid_x[0])
+        self.x_max = float(grid_x[-1])
+        self.step = (self.x_max - self.x_min) / (n - 1) if n > 1 else 0.0
+        self.tolerance = tolerance  # how far past either end a sample still counts as covered
+        # extended data is always uniform; anything else falls back to np.interp (binary search)
+        self._grid_x = None
+        if n > 2 and not np.allclose(np.diff(grid_x), self.step, rtol=0, atol=tolerance):
+            self._grid_x = grid_x
+        self.compensated = 0
+        self.out_of_range = 0
+
+    def __len__(self):
+        return len(self.grid_y)
+
+    def reset_counts(self):
+        self.compensated = 0
+        self.out_of_range = 0
+
+    def values(self, x):
+        """Reference at `x` (inside the covered range), interpolated."""
+        x = np.asarray(x, dtype=np.float64)
+        if self._grid_x is not None:
+            return np.interp(x, self._grid_x, self.grid_y)
+        if self.step == 0.0:
+            return np.full(len(x), self.grid_y[0])
+        position = (x - self.x_min) / self.step
+        index = np.clip(np.floor(position).astype(np.int64), 0, len(self.grid_y) - 2)
+        fraction = position - index
+        return self.grid_y[index] + fraction * (self.grid_y[index + 1] - self.grid_y[index])
+
+    def subtract(self, x, y):
+        """Returns (x, y - reference) for the samples the reference covers."""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        inside = (x >= self.x_min - self.tolerance) & (x <= self.x_max + self.tolerance)
+        n_inside = int(np.count_nonzero(inside))
+        if n_inside < len(x):
+            self.out_of_range += len(x) - n_inside
+            x, y = x[inside], y[inside]
+        self.compensated += n_inside
+        return x, y - self.values(x)
+
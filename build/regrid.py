@@ -0,0 +1,40 @@
+# regrid.py
+#
+# Resampling of raw (x, y) samples onto the uniform grid that all numeric
+# processing (trend, ptp, filtering, reference subtraction) works on. Raw data
+# is irregularly spaced and usually holds many samples per x position (the
+# carriage standing still), so samples closer together than `tolerance` are
+# first collapsed to their mean, then linearly interpolated every `step`.
+#
+# One sort-and-group pass (np.unique + bincount), so it stays O(N log N)
+# instead of scanning the whole array once per unique x value.
+
+import numpy as np
+
+DEFAULT_TOLERANCE = 1e-5  # x values this close are the same position (sensor resolution is 1e-4)
+DEFAULT_STEP = 0.001  # 1mm grid, x is in m
+
+
+def collapse_duplicates(x_data, y_data, tolerance=DEFAULT_TOLERANCE):
+    """Averages all samples whose x falls in the same `tolerance`-wide bin.
+    Returns the sorted bin positions (mean x per bin) and mean y per bin.
+    tolerance=0 groups exact duplicates only."""
+    x_data = np.asarray(x_data, dtype=np.float64)
+    y_data = np.asarray(y_data, dtype=np.float64)
+    keys = np.round(x_data / tolerance) if tolerance > 0 else x_data
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    x_mean = np.bincount(inverse, weights=x_data) / counts
+    y_mean = np.bincount(inverse, weights=y_data) / counts
+    return x_mean, y_mean
+
+
+def regrid(x_data, y_data, step=DEFAULT_STEP, tolerance=DEFAULT_TOLERANCE):
+    """Collapses duplicate x and interpolates onto a uniform grid from min(x)
+    to max(x) every `step`. Returns the (grid_x, grid_y) arrays."""
+    x_data = np.asarray(x_data, dtype=np.float64)
+    if len(x_data) == 0:
+        raise ValueError("No data points to regrid.")
+    x_unique, y_unique = collapse_duplicates(x_data, y_data, tolerance)
+    grid_x = np.arange(x_data.min(), x_data.max() + step, step)
+    grid_y = np.interp(grid_x, x_unique, y_unique)
+    return grid_x, grid_y